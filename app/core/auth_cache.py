@@ -0,0 +1,108 @@
+import threading
+import time
+
+from cachetools import TTLCache
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.realtime_backend import on_internal
+from app.models import UserModel
+
+
+class TokenCache:
+    """
+    Bounded TTL cache of verified access tokens -> a snapshot of their user
+    (id, username, lat, long, credentials version).
+
+    A hit is served from the snapshot without touching the database, so
+    lat/long may be up to `ttl` seconds old. A password change revokes
+    cached tokens through `invalidate_user`, published to every worker over
+    the realtime bus; workers that miss it drop them once the TTL runs out.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.enabled = maxsize > 0 and ttl > 0
+        self._cache: TTLCache = TTLCache(maxsize=max(maxsize, 1), ttl=max(ttl, 0.001))
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, token: str) -> tuple[int, str, float | None, float | None, int] | None:
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._cache.get(token)
+
+            # The token may expire before the cache entry does
+            if entry is None or entry[1] <= time.time():
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return entry[0]
+
+    def resolve(self, db_session: Session, token: str) -> UserModel | None:
+        """
+        The cached user of `token` attached to `db_session` without a query,
+        None when the token is not cached. Columns outside the snapshot,
+        like the password, are loaded when first accessed.
+        """
+
+        snapshot = self.get(token)
+        if snapshot is None:
+            return None
+
+        user_id, username, lat, long, version = snapshot
+        user = UserModel(id=user_id, username=username, lat=lat, long=long, credentials_version=version)
+        make_transient_to_detached(user)
+        return db_session.merge(user, load=False)
+
+    def set(self, token: str, user: UserModel, expires_at: float):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            snapshot = (user.id, user.username, user.lat, user.long, user.credentials_version)
+            self._cache[token] = (snapshot, expires_at)
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            tokens = [token for token, (snapshot, _) in self._cache.items() if snapshot[0] == user_id]
+            for token in tokens:
+                self._cache.pop(token, None)
+
+            self.invalidations += len(tokens)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._cache),
+            "max_size": self._cache.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+token_cache = TokenCache(maxsize=settings.AUTH_CACHE_MAX_SIZE, ttl=settings.AUTH_CACHE_TTL)
+# Published by password changes, see `socket_manager.revoke_user_tokens`
+on_internal("revoke_user_tokens", token_cache.invalidate_user)
+metrics.register_stats(
+    "Verified token cache.",
+    token_cache.stats,
+    counters={"hits": "token_cache_hits", "misses": "token_cache_misses", "invalidations": "token_cache_invalidations"},
+    gauges={"size": "token_cache_entries", "max_size": "token_cache_max_entries"},
+)
+
+
+@event.listens_for(UserModel, "after_delete")
+def _invalidate_deleted_user(mapper, connection, target: UserModel):
+    token_cache.invalidate_user(target.id)
@@ -1,3 +1,4 @@
+import os
 import secrets
 import warnings
 from typing import Annotated, Any, Literal
@@ -42,6 +43,110 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str 
     POSTGRES_DB: str
 
+    # Verified access tokens kept in memory, 0 disables the cache. Revoked
+    # tokens are dropped from every worker over the realtime bus, and after
+    # the TTL at the latest
+    AUTH_CACHE_TTL: float = 60
+    AUTH_CACHE_MAX_SIZE: int = 10_000
+    # Confirmed group memberships kept in memory, 0 disables the cache
+    MEMBERSHIP_CACHE_TTL: float = 60
+    MEMBERSHIP_CACHE_MAX_SIZE: int = 100_000
+
+    # Realtime position broadcasts per second for each group, 0 disables tick mode
+    POSITION_TICK_RATE: float = 0
+    # Write-behind persistence of live positions
+    POSITION_FLUSH_INTERVAL: float = 5
+    POSITION_FLUSH_BATCH_SIZE: int = 500
+    # Position history, ingested in batches from the live stream
+    POSITION_HISTORY_ENABLED: bool = True
+    POSITION_HISTORY_FLUSH_INTERVAL: float = 2
+    POSITION_HISTORY_BATCH_SIZE: int = 1000
+    POSITION_HISTORY_MAX_PENDING: int = 100_000
+    # Failed writes of a batch before it is split in halves, single rows are dropped
+    POSITION_FLUSH_MAX_ATTEMPTS: int = 3
+
+    # Message bus shared by workers (memory://, redis://, amqp://), unset runs a single process
+    REALTIME_BACKEND_URL: str | None = None
+    # Store for live rosters and positions, defaults to REALTIME_BACKEND_URL
+    REALTIME_STATE_BACKEND_URL: str | None = None
+    # Seconds between batched writes of updated members to the state store,
+    # 0 writes on every update
+    REALTIME_STATE_FLUSH_INTERVAL: float = 0.5
+    # Members not rewritten for this long (seconds) are dropped from rosters,
+    # local members are rewritten every third of it, 0 keeps them forever
+    REALTIME_MEMBER_TTL: float = 60
+
+    # Updates closer than this (metres) or sooner than this (seconds) to the
+    # last broadcast of a user are not sent, 0 disables each filter
+    POSITION_MIN_DISTANCE: float = 0
+    POSITION_MIN_INTERVAL: float = 0
+    # Seconds after which an update is always broadcast
+    POSITION_KEEPALIVE_INTERVAL: float = 30
+
+    # Cell width in degrees of the per-group spatial index of live positions
+    SPATIAL_CELL_SIZE: float = 0.01
+
+    # Connection pool of the shared engine, a recycle of -1 keeps connections forever
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800
+    # Statements slower than this (seconds) are logged, 0 disables the log
+    DB_SLOW_QUERY_THRESHOLD: float = 0.5
+
+    # Resolution of the shared timer wheel (seconds)
+    SCHEDULER_TICK: float = 0.1
+    # Seconds a disconnected user stays in the group, to ride out reconnects
+    DISCONNECT_GRACE_PERIOD: float = 10
+    # Positions not refreshed for this long leave the spatial index, 0 keeps them
+    POSITION_STALE_AFTER: float = 0
+    # Recent events kept per group for reconnecting sockets, 0 always sends a snapshot
+    RESUME_BUFFER_SIZE: int = 256
+    # Sockets with this many engine.io packets waiting to be sent are slow
+    # consumers, their position updates are queued latest-wins instead, 0
+    # disables the check
+    OUTBOUND_HIGH_WATERMARK: int = 64
+    # Slow consumers get their queued updates once back under this many packets
+    OUTBOUND_LOW_WATERMARK: int = 8
+    OUTBOUND_QUEUE_SIZE: int = 1024
+    OUTBOUND_CHECK_INTERVAL: float = 0.25
+    # Seconds a socket may stay a slow consumer before it is disconnected, 0 never
+    SLOW_CONSUMER_TIMEOUT: float = 30
+    # Position updates accepted per user and second, and burst above it, 0 disables the limit
+    POSITION_RATE_LIMIT: float = 5
+    POSITION_RATE_BURST: int = 10
+    # Seconds a client timestamp may differ from the server clock
+    POSITION_TIMESTAMP_TOLERANCE: float = 600
+    # Largest inbound Socket.IO message (bytes), bigger ones close the connection
+    SOCKET_MAX_MESSAGE_SIZE: int = 16384
+
+    # Threads used for blocking DB work issued from the event loop
+    DB_EXECUTOR_WORKERS: int = 8
+    # Event loop lag sampling, 0 disables the monitor
+    LOOP_LAG_SAMPLE_INTERVAL: float = 0.5
+    LOOP_LAG_REPORT_INTERVAL: float = 60
+    # Reports with a p99 lag above this (seconds) are logged as warnings
+    LOOP_LAG_WARNING_THRESHOLD: float = 0.1
+
+    # bcrypt cost, hashes with another cost are upgraded on the next login
+    PASSWORD_HASH_ROUNDS: int = 12
+    # Threads dedicated to password hashing, and hashes allowed to wait for
+    # one before requests are rejected with 503
+    PASSWORD_HASH_WORKERS: int = os.cpu_count() or 1
+    PASSWORD_HASH_MAX_PENDING: int = 64
+
+    # Prometheus metrics collection. They are served at /metrics only when
+    # METRICS_TOKEN is set, as a bearer token scrapers must send, and/or on
+    # their own server at METRICS_PORT (one port per worker process)
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: str | None = None
+    METRICS_PORT: int = 0
+
+    # Page size of the list endpoints
+    PAGE_SIZE_DEFAULT: int = 50
+    PAGE_SIZE_MAX: int = 200
+
     @computed_field  # type: ignore[prop-decorator]
     @property
     def SQLALCHEMY_DATABASE_URI(self) -> PostgresDsn:
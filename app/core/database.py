@@ -1,13 +1,177 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import Annotated
 from fastapi import Depends
-from sqlalchemy import create_engine, select
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import QueuePool
+from app.core import metrics
 from app.core.config import settings
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+logger = logging.getLogger(__name__)
 
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class DatabaseStats:
+    """
+    Connection checkout waits and statement timings of the engine.
+
+    A growing checkout wait with fast statements points at pool starvation,
+    slow statements with short waits point at the queries themselves.
+    """
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._checkout_waits: deque[float] = deque(maxlen=window)
+        self._statement_times: deque[float] = deque(maxlen=window)
+
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+
+        self.statements = 0
+        self.statement_time_total = 0.0
+        self.statement_time_max = 0.0
+        self.slow_statements = 0
+
+    def record_checkout(self, wait: float):
+        with self._lock:
+            self._checkout_waits.append(wait)
+            self.checkouts += 1
+            self.checkout_wait_total += wait
+            self.checkout_wait_max = max(self.checkout_wait_max, wait)
+        metrics.db_checkout_wait.observe(wait)
+
+    def record_timeout(self):
+        with self._lock:
+            self.checkout_timeouts += 1
+
+    def record_statement(self, elapsed: float, slow: bool):
+        with self._lock:
+            self._statement_times.append(elapsed)
+            self.statements += 1
+            self.statement_time_total += elapsed
+            self.statement_time_max = max(self.statement_time_max, elapsed)
+            self.slow_statements += slow
+        metrics.db_statement_duration.observe(elapsed)
+
+    @staticmethod
+    def _percentile(samples: list[float], q: float) -> float:
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._checkout_waits)
+            times = sorted(self._statement_times)
+
+            stats = {
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.checkout_timeouts,
+                "checkout_wait_total": self.checkout_wait_total,
+                "checkout_wait_max": self.checkout_wait_max,
+                "checkout_wait_p50": self._percentile(waits, 0.5),
+                "checkout_wait_p99": self._percentile(waits, 0.99),
+                "statements": self.statements,
+                "slow_statements": self.slow_statements,
+                "statement_time_total": self.statement_time_total,
+                "statement_time_max": self.statement_time_max,
+                "statement_time_p50": self._percentile(times, 0.5),
+                "statement_time_p99": self._percentile(times, 0.99),
+            }
+
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            stats.update(
+                pool_size=pool.size(),
+                pool_checked_out=pool.checkedout(),
+                pool_checked_in=pool.checkedin(),
+                pool_overflow=max(pool.overflow(), 0),
+            )
+
+        return stats
+
+
+db_stats = DatabaseStats()
+metrics.register_stats(
+    "Connection pool and statements.",
+    db_stats.stats,
+    counters={
+        "checkouts": "db_checkouts",
+        "checkout_timeouts": "db_checkout_timeouts",
+        "statements": "db_statements",
+        "slow_statements": "db_slow_statements",
+    },
+    gauges={
+        "pool_size": "db_pool_size",
+        "pool_checked_out": "db_pool_checked_out",
+        "pool_checked_in": "db_pool_checked_in",
+        "pool_overflow": "db_pool_overflow",
+    },
+)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool recording how long each checkout waited for a connection,
+    including the time to open a new one.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            db_stats.record_timeout()
+            raise
+        finally:
+            db_stats.record_checkout(time.perf_counter() - start)
+
+
+engine = create_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=InstrumentedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+)
+
+
+# The start time lives on the execution context, so a failed statement
+# leaves nothing behind on the connection
+@event.listens_for(engine, "before_cursor_execute")
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._statement_start = time.perf_counter()
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_statement_start", None)
+    if start is None:
+        return
+
+    elapsed = time.perf_counter() - start
+    slow = 0 < settings.DB_SLOW_QUERY_THRESHOLD <= elapsed
+
+    if slow:
+        logger.warning(f"Slow statement ({elapsed * 1000:.1f}ms): {statement}")
+
+    db_stats.record_statement(elapsed, slow)
+
+
+# The one session factory, used by REST dependencies, socket handlers and
+# background writers alike
+SessionLocal = sessionmaker(autocommit=False, bind=engine)
 
 
 def get_db_session():
@@ -19,3 +183,15 @@ def get_db_session():
 
 
 SessionDep = Annotated[Session, Depends(get_db_session)]
+
+
+# Blocking DB work issued from the event loop runs here, so a slow query
+# never stalls the loop and never exhausts the default executor.
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_EXECUTOR_WORKERS, thread_name_prefix="db"
+)
+
+
+async def run_in_db_executor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, partial(func, *args, **kwargs))
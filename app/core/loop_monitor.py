@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from collections import deque
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up from a fixed sleep.
+
+    Any blocking call on the loop shows up as lag here, so p50/p99 are
+    available through `stats()` and periodically logged, as a warning when
+    p99 reaches `warning_threshold`.
+    """
+
+    def __init__(self, interval: float, report_interval: float, warning_threshold: float, window: int = 1000):
+        self.interval = interval
+        self.report_interval = report_interval
+        self.warning_threshold = warning_threshold
+        self._samples: deque[float] = deque(maxlen=window)
+        self._task: asyncio.Task | None = None
+        self.max_lag = 0.0
+
+    def start(self):
+        if self.interval <= 0:
+            return
+
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def percentile(self, q: float) -> float:
+        if not self._samples:
+            return 0.0
+
+        samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def stats(self) -> dict:
+        return {
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "max": self.max_lag,
+            "samples": len(self._samples),
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        last_report = loop.time()
+
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+
+            lag = max(0.0, now - expected)
+            self._samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+            if now - last_report >= self.report_interval:
+                last_report = now
+                stats = self.stats()
+                level = logging.WARNING if stats["p99"] >= self.warning_threshold else logging.DEBUG
+                logger.log(
+                    level,
+                    f"Event loop lag p50={stats['p50'] * 1000:.1f}ms "
+                    f"p99={stats['p99'] * 1000:.1f}ms max={stats['max'] * 1000:.1f}ms"
+                )
+
+
+loop_monitor = LoopLagMonitor(
+    interval=settings.LOOP_LAG_SAMPLE_INTERVAL,
+    report_interval=settings.LOOP_LAG_REPORT_INTERVAL,
+    warning_threshold=settings.LOOP_LAG_WARNING_THRESHOLD,
+)
+metrics.register_stats(
+    "Event loop lag over the recent samples.",
+    loop_monitor.stats,
+    gauges={"p50": "loop_lag_p50_seconds", "p99": "loop_lag_p99_seconds", "max": "loop_lag_max_seconds"},
+)
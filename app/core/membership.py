@@ -0,0 +1,115 @@
+import threading
+
+from cachetools import TTLCache
+from sqlalchemy import Select, exists, select
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+from app.core.config import settings
+from app.models import GroupModel, UserModel, _UserGroupModel
+
+
+class MembershipService:
+    """
+    Group membership checks as a single indexed EXISTS probe on `user_group`,
+    and membership writes, which also bump the members' `groups_version`.
+
+    Positive answers are cached in memory, so a user who joins is never
+    denied by a stale entry. Joins, leaves and group deletions handled by
+    this worker invalidate the cache right away, other workers catch up
+    within the TTL.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.enabled = maxsize > 0 and ttl > 0
+        self._cache: TTLCache = TTLCache(maxsize=max(maxsize, 1), ttl=max(ttl, 0.001))
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def is_member(self, db_session: Session, user_id: int, group_id: int) -> bool:
+        key = (user_id, group_id)
+
+        if self.enabled:
+            with self._lock:
+                if key in self._cache:
+                    self.hits += 1
+                    return True
+                self.misses += 1
+
+        stmt = select(
+            exists().where(
+                _UserGroupModel.user_id == user_id,
+                _UserGroupModel.group_id == group_id,
+            )
+        )
+        member = bool(db_session.scalar(stmt))
+
+        if member and self.enabled:
+            with self._lock:
+                self._cache[key] = True
+
+        return member
+
+    def groups_of(self, user_id: int) -> Select:
+        return select(GroupModel).join(
+            _UserGroupModel, _UserGroupModel.group_id == GroupModel.id
+        ).where(_UserGroupModel.user_id == user_id)
+
+    def members_of(self, group_id: int) -> Select:
+        return select(UserModel).join(
+            _UserGroupModel, _UserGroupModel.user_id == UserModel.id
+        ).where(_UserGroupModel.group_id == group_id)
+
+    def add(self, db_session: Session, user_id: int, group_id: int):
+        if not self.is_member(db_session, user_id, group_id):
+            # A concurrent join of the same user is skipped by the database
+            _UserGroupModel.upsert(
+                db_session,
+                [{"user_id": user_id, "group_id": group_id}],
+                index_elements=["user_id", "group_id"],
+                commit=False,
+            )
+            UserModel.bump_groups_version(db_session, UserModel.id == user_id)
+            db_session.commit()
+
+    def remove(self, db_session: Session, user_id: int, group_id: int):
+        _UserGroupModel.delete_where(db_session, user_id=user_id, group_id=group_id, commit=False)
+        UserModel.bump_groups_version(db_session, UserModel.id == user_id)
+        db_session.commit()
+        self.invalidate(user_id, group_id)
+
+    def delete_group(self, db_session: Session, group: GroupModel):
+        members = select(_UserGroupModel.user_id).where(_UserGroupModel.group_id == group.id)
+        UserModel.bump_groups_version(db_session, UserModel.id.in_(members))
+        group.delete(db_session)
+        self.invalidate_group(group.id)
+
+    def invalidate(self, user_id: int, group_id: int):
+        with self._lock:
+            self._cache.pop((user_id, group_id), None)
+
+    def invalidate_group(self, group_id: int):
+        with self._lock:
+            for key in [key for key in self._cache if key[1] == group_id]:
+                self._cache.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._cache),
+            "max_size": self._cache.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+membership = MembershipService(
+    maxsize=settings.MEMBERSHIP_CACHE_MAX_SIZE, ttl=settings.MEMBERSHIP_CACHE_TTL
+)
+metrics.register_stats(
+    "Group membership cache.",
+    membership.stats,
+    counters={"hits": "membership_cache_hits", "misses": "membership_cache_misses"},
+    gauges={"size": "membership_cache_entries", "max_size": "membership_cache_max_entries"},
+)
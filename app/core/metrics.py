@@ -0,0 +1,153 @@
+from typing import Callable, Iterable
+
+from prometheus_client import CollectorRegistry, Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.metrics import MetricWrapperBase
+from prometheus_client.registry import Collector
+
+PREFIX = "groupmaps_"
+
+# Latency buckets in seconds, from sub-millisecond emits to slow requests
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+registry = CollectorRegistry()
+
+
+class StatsCollector(Collector):
+    """
+    Exposes entries of a component's `stats()` dict, read at scrape time.
+
+    `counters` and `gauges` map stats keys to metric names (without the
+    prefix), so cumulative values become `_total` counters and levels stay
+    gauges, each in its own family.
+    """
+
+    def __init__(
+        self,
+        documentation: str,
+        stats: Callable[[], dict],
+        counters: dict[str, str] | None = None,
+        gauges: dict[str, str] | None = None,
+    ):
+        self.documentation = documentation
+        self.stats = stats
+        self.counters = counters or {}
+        self.gauges = gauges or {}
+
+    def describe(self):
+        # Names are known upfront, no need to call `stats()` on registration
+        for key, name in self.counters.items():
+            yield CounterMetricFamily(f"{PREFIX}{name}", self._help(key))
+        for key, name in self.gauges.items():
+            yield GaugeMetricFamily(f"{PREFIX}{name}", self._help(key))
+
+    def collect(self):
+        values = self.stats()
+        for key, name in self.counters.items():
+            if key in values:
+                yield CounterMetricFamily(f"{PREFIX}{name}", self._help(key), value=values[key])
+        for key, name in self.gauges.items():
+            if key in values:
+                yield GaugeMetricFamily(f"{PREFIX}{name}", self._help(key), value=values[key])
+
+    def _help(self, key: str) -> str:
+        return f"{self.documentation} ({key})"
+
+
+class CallbackGauge(Collector):
+    """
+    Gauge read from `collect` at scrape time. `collect` returns a value, or
+    a dict of label values (a tuple, or a single value) to values.
+    """
+
+    def __init__(self, name: str, documentation: str, collect: Callable, labelnames: Iterable[str] = ()):
+        self.name = f"{PREFIX}{name}"
+        self.documentation = documentation
+        self.callback = collect
+        self.labelnames = list(labelnames)
+
+    def describe(self):
+        yield GaugeMetricFamily(self.name, self.documentation, labels=self.labelnames)
+
+    def collect(self):
+        values = self.callback()
+        family = GaugeMetricFamily(self.name, self.documentation, labels=self.labelnames)
+
+        if not isinstance(values, dict):
+            family.add_metric([], values)
+        else:
+            for labels, value in values.items():
+                labels = labels if isinstance(labels, tuple) else (labels,)
+                family.add_metric([str(label) for label in labels], value)
+
+        yield family
+
+
+def register_stats(
+    documentation: str,
+    stats: Callable[[], dict],
+    counters: dict[str, str] | None = None,
+    gauges: dict[str, str] | None = None,
+):
+    registry.register(StatsCollector(documentation, stats, counters, gauges))
+
+
+def register_gauge(name: str, documentation: str, collect: Callable, labelnames: Iterable[str] = ()):
+    registry.register(CallbackGauge(name, documentation, collect, labelnames))
+
+
+def discard(metric: MetricWrapperBase, *labels):
+    """
+    Drops one labelled series, if it exists.
+    """
+
+    try:
+        metric.remove(*labels)
+    except KeyError:
+        pass
+
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+    return Counter(f"{PREFIX}{name}", documentation, labelnames, registry=registry)
+
+
+def histogram(name: str, documentation: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+    return Histogram(f"{PREFIX}{name}", documentation, labelnames, registry=registry, buckets=buckets)
+
+
+# Socket layer
+socket_connects = counter("socket_connects_total", "Accepted socket connections.")
+socket_disconnects = counter("socket_disconnects_total", "Socket disconnections.")
+socket_rejections = counter("socket_rejections_total", "Rejected socket connections.", ["reason"])
+position_updates = counter(
+    "position_updates_total", "Position updates received, by group.", ["group"]
+)
+position_broadcasts = counter(
+    "position_broadcasts_total",
+    "Position updates broadcast or suppressed by the movement filter, and suppressed ones sent later (held), by group.",
+    ["group", "result"],
+)
+socket_resumes = counter(
+    "socket_resumes_total", "Socket joins by how the group state was sent.", ["mode"]
+)
+inbound_rejections = counter(
+    "socket_inbound_rejections_total", "Client events dropped, by event and reason.", ["event", "reason"]
+)
+outbound_drops = counter(
+    "outbound_drops_total", "Queued position updates dropped for slow consumers.", ["reason"]
+)
+slow_consumer_disconnects = counter(
+    "slow_consumer_disconnects_total", "Sockets disconnected for staying behind too long."
+)
+emit_duration = histogram(
+    "emit_duration_seconds", "Time to fan out an event to a room.", ["event"]
+)
+
+# REST
+http_request_duration = histogram(
+    "http_request_duration_seconds", "REST request latency, by route.", ["route", "method", "status"]
+)
+
+# Database
+db_statement_duration = histogram("db_statement_duration_seconds", "Duration of SQL statements.")
+db_checkout_wait = histogram("db_checkout_wait_seconds", "Time waited for a pooled connection.")
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime
+
+
+from app.core.database import SessionLocal, run_in_db_executor
+from app.models import PositionHistoryModel, UserModel
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter(ABC):
+    """
+    Buffers rows from the socket layer and persists them in bulk every
+    `interval` seconds (and on shutdown) on the DB executor.
+
+    A failed batch is retried first on the next flush. After
+    `max_attempts` failures it is split in halves, so a row that can never
+    be written is isolated and dropped instead of blocking the rows behind
+    it.
+    """
+
+    name = "batch"
+
+    def __init__(self, interval: float, batch_size: int, max_attempts: int = 3):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max(max_attempts, 1)
+
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        # Failed batches with their attempt count, retried before new rows
+        self._retries: deque[tuple[object, int]] = deque()
+
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.dropped = 0
+        self.rows_written = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+    @property
+    @abstractmethod
+    def pending(self) -> int:
+        ...
+
+    @abstractmethod
+    def _take(self, size: int):
+        ...
+
+    @staticmethod
+    def _split(batch) -> list:
+        items = list(batch.items()) if isinstance(batch, dict) else list(batch)
+        middle = len(items) // 2
+        return [type(batch)(items[:middle]), type(batch)(items[middle:])]
+
+    @staticmethod
+    @abstractmethod
+    def _write(batch):
+        ...
+
+    def start(self):
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+        await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            while self._retries or self.pending:
+                if self._retries:
+                    batch, attempts = self._retries.popleft()
+                else:
+                    batch, attempts = self._take(self.batch_size), 0
+
+                started = time.perf_counter()
+                try:
+                    await run_in_db_executor(self._write, batch)
+                except Exception as e:
+                    self.flush_errors += 1
+                    logger.error(f"Error in flush {self.name}: {e}")
+                    self._retry(batch, attempts + 1)
+                    return
+
+                latency = time.perf_counter() - started
+                self.flush_count += 1
+                self.rows_written += len(batch)
+                self.last_flush_latency = latency
+                self.max_flush_latency = max(self.max_flush_latency, latency)
+                self.total_flush_latency += latency
+
+    def _retry(self, batch, attempts: int):
+        if attempts < self.max_attempts:
+            self._retries.appendleft((batch, attempts))
+        elif len(batch) > 1:
+            for part in reversed(self._split(batch)):
+                self._retries.appendleft((part, 0))
+        else:
+            self.dropped += 1
+            logger.error(f"Dropped a {self.name} row after {attempts} failed writes: {batch}")
+
+    def stats(self) -> dict:
+        return {
+            "flush_interval": self.interval,
+            "batch_size": self.batch_size,
+            "pending": self.pending + sum(len(batch) for batch, _ in self._retries),
+            "flush_count": self.flush_count,
+            "flush_errors": self.flush_errors,
+            "dropped": self.dropped,
+            "rows_written": self.rows_written,
+            "last_flush_latency": self.last_flush_latency,
+            "max_flush_latency": self.max_flush_latency,
+            "total_flush_latency": self.total_flush_latency,
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+
+class PositionWriter(BatchWriter):
+    """
+    Write-behind buffer for the last known position of each user.
+    """
+
+    name = "user positions"
+
+    def __init__(self, interval: float, batch_size: int, max_attempts: int = 3):
+        super().__init__(interval, batch_size, max_attempts)
+        self._dirty: dict[int, tuple[float | None, float | None]] = {}
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def mark(self, user_id: int, lat: float | None, long: float | None):
+        self._dirty[user_id] = (lat, long)
+
+    def _take(self, size: int) -> dict[int, tuple[float | None, float | None]]:
+        batch = dict(list(self._dirty.items())[:size])
+        for user_id in batch:
+            self._dirty.pop(user_id)
+        return batch
+
+    @staticmethod
+    def _write(batch: dict[int, tuple[float | None, float | None]]):
+        with SessionLocal() as db_session:
+            UserModel.bulk_update(
+                db_session,
+                [{"id": user_id, "lat": lat, "long": long} for user_id, (lat, long) in batch.items()],
+            )
+
+
+class HistoryWriter(BatchWriter):
+    """
+    Append-only buffer of position history rows, inserted in multi-row batches.
+
+    When the database falls behind, the oldest rows beyond `max_pending` are
+    dropped instead of slowing down the socket layer.
+    """
+
+    name = "position history"
+
+    def __init__(self, interval: float, batch_size: int, max_pending: int, max_attempts: int = 3):
+        super().__init__(interval, batch_size, max_attempts)
+        self.max_pending = max_pending
+        self._rows: deque[dict] = deque(maxlen=max_pending)
+
+    @property
+    def pending(self) -> int:
+        return len(self._rows)
+
+    def add(self, user_id: int, group_id: int, lat: float, long: float, recorded_at: datetime):
+        # The bounded deque evicts the oldest row itself
+        if len(self._rows) == self.max_pending:
+            self.dropped += 1
+
+        self._rows.append(
+            {"user_id": user_id, "group_id": group_id, "lat": lat, "long": long, "recorded_at": recorded_at}
+        )
+
+    def _take(self, size: int) -> list[dict]:
+        return [self._rows.popleft() for _ in range(min(size, len(self._rows)))]
+
+    @staticmethod
+    def _write(batch: list[dict]):
+        with SessionLocal() as db_session:
+            PositionHistoryModel.bulk_create(db_session, batch)
@@ -0,0 +1,265 @@
+import asyncio
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+logger = logging.getLogger(__name__)
+
+# Reserved event carrying messages between workers, never sent to clients
+INTERNAL_EVENT = "__group_maps_internal"
+
+# message kind -> handler(payload), run by every worker
+_internal_handlers: dict[str, Callable[[Any], Any]] = {}
+
+
+def on_internal(kind: str, handler: Callable[[Any], Any]):
+    _internal_handlers[kind] = handler
+
+
+def _dispatch_internal(kind: str, payload):
+    handler = _internal_handlers.get(kind)
+    if handler is None:
+        logger.warning(f"No handler for internal message {kind!r}")
+        return
+
+    handler(payload)
+
+
+async def publish_internal(manager, kind: str, payload):
+    """
+    Runs the `kind` handler on every worker sharing the Socket.IO bus of
+    `manager`, this one included, or only here without a bus.
+    """
+
+    if isinstance(manager, InternalMessagesMixin):
+        await manager.emit(INTERNAL_EVENT, (kind, payload), namespace="/")
+    else:
+        _dispatch_internal(kind, payload)
+
+
+class InternalMessagesMixin:
+    """
+    Pub/sub client manager mixin handing `INTERNAL_EVENT` emits, local or
+    from other workers, to the `on_internal` handlers instead of clients.
+    """
+
+    async def _handle_emit(self, message):
+        if message.get("event") != INTERNAL_EVENT:
+            return await super()._handle_emit(message)
+
+        kind, payload = message["data"]
+        _dispatch_internal(kind, payload)
+
+
+class RedisManager(InternalMessagesMixin, socketio.AsyncRedisManager):
+    pass
+
+
+class AioPikaManager(InternalMessagesMixin, socketio.AsyncAioPikaManager):
+    pass
+
+
+class LoopbackManager(InternalMessagesMixin, AsyncPubSubManager):
+    """
+    Socket.IO pub/sub client manager backed by an in-process bus.
+
+    Every server created in the same process with the same channel shares
+    rooms and broadcasts, which allows exercising multi-worker fan-out on a
+    single machine without any external service.
+    """
+
+    name = "loopback"
+
+    _bus: dict[str, set[asyncio.Queue]] = {}
+
+    def __init__(self, channel: str = "socketio", write_only: bool = False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+        if not write_only:
+            self._bus.setdefault(channel, set()).add(self._queue)
+
+    async def _publish(self, data):
+        for queue in self._bus.get(self.channel, ()):
+            queue.put_nowait(data)
+
+    async def _listen(self):
+        while True:
+            yield await self._queue.get()
+
+
+class StateBackend(ABC):
+    """
+    Live group rosters and positions shared by every worker.
+
+    Each member is stored with an `owner` token naming the socket that
+    wrote it, so a worker only removes members it still owns. Members not
+    written for `member_ttl` seconds, left behind by a worker that died,
+    are dropped when the group is read, 0 keeps them.
+    """
+
+    def __init__(self, member_ttl: float = 0):
+        self.member_ttl = member_ttl
+
+    def _cutoff(self) -> float:
+        return time.time() - self.member_ttl if self.member_ttl > 0 else float("-inf")
+
+    @abstractmethod
+    async def set_members(self, members: list[tuple[str, int, dict, str]]):
+        """
+        Stores a batch of (group id, user id, data, owner) members.
+        """
+
+    @abstractmethod
+    async def remove_member(self, group_id: str, user_id: int, owner: str) -> bool:
+        """
+        Removes the member if `owner` still owns it, returns whether it did.
+        """
+
+    @abstractmethod
+    async def get_members(self, group_id: str) -> list[dict]:
+        ...
+
+
+class MemoryStateBackend(StateBackend):
+    """
+    Process-local backend, shared by every manager that holds the instance.
+    """
+
+    def __init__(self, member_ttl: float = 0):
+        super().__init__(member_ttl)
+        # group id -> user id -> (owner, data, last write)
+        self._groups: dict[str, dict[int, tuple[str, dict, float]]] = {}
+
+    async def set_members(self, members: list[tuple[str, int, dict, str]]):
+        now = time.time()
+        for group_id, user_id, data, owner in members:
+            self._groups.setdefault(group_id, {})[user_id] = (owner, data, now)
+
+    async def remove_member(self, group_id: str, user_id: int, owner: str) -> bool:
+        members = self._groups.get(group_id)
+        if members is None or members.get(user_id, (None,))[0] != owner:
+            return False
+
+        del members[user_id]
+        if not members:
+            self._groups.pop(group_id, None)
+        return True
+
+    async def get_members(self, group_id: str) -> list[dict]:
+        members = self._groups.get(group_id, {})
+        cutoff = self._cutoff()
+
+        for user_id in [user_id for user_id, (_, _, seen) in members.items() if seen < cutoff]:
+            del members[user_id]
+
+        return [data for _, data, _ in members.values()]
+
+
+class RedisStateBackend(StateBackend):
+    """
+    Redis backend, per group one hash of user id -> member data, one of
+    user id -> owner token, and a sorted set of user ids by last write.
+    """
+
+    # Deletes the member only if the owner matches, in one round trip
+    REMOVE_SCRIPT = """
+    if redis.call('HGET', KEYS[2], ARGV[1]) == ARGV[2] then
+        redis.call('HDEL', KEYS[1], ARGV[1])
+        redis.call('HDEL', KEYS[2], ARGV[1])
+        redis.call('ZREM', KEYS[3], ARGV[1])
+        return 1
+    end
+    return 0
+    """
+
+    # Drops members last written before ARGV[1], then reads the group
+    READ_SCRIPT = """
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', '(' .. ARGV[1])
+    for _, user_id in ipairs(expired) do
+        redis.call('HDEL', KEYS[1], user_id)
+        redis.call('HDEL', KEYS[2], user_id)
+    end
+    if #expired > 0 then
+        redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', '(' .. ARGV[1])
+    end
+    return redis.call('HVALS', KEYS[1])
+    """
+
+    def __init__(self, url: str, prefix: str = "group_maps", ttl: int = 60 * 60 * 24, member_ttl: float = 0):
+        import redis.asyncio as redis
+
+        super().__init__(member_ttl)
+        self._redis = redis.from_url(url)
+        self.prefix = prefix
+        self.ttl = ttl
+        self._remove = self._redis.register_script(self.REMOVE_SCRIPT)
+        self._read = self._redis.register_script(self.READ_SCRIPT)
+
+    def _keys(self, group_id: str) -> list[str]:
+        base = f"{self.prefix}:group:{group_id}"
+        return [f"{base}:members", f"{base}:owners", f"{base}:seen"]
+
+    async def set_members(self, members: list[tuple[str, int, dict, str]]):
+        now = time.time()
+        groups: dict[str, tuple[dict, dict, dict]] = {}
+        for group_id, user_id, data, owner in members:
+            values, owners, seen = groups.setdefault(group_id, ({}, {}, {}))
+            values[str(user_id)] = json.dumps(data)
+            owners[str(user_id)] = owner
+            seen[str(user_id)] = now
+
+        # One round trip for the whole batch
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for group_id, (values, owners, seen) in groups.items():
+                key, owners_key, seen_key = self._keys(group_id)
+                pipe.hset(key, mapping=values)
+                pipe.hset(owners_key, mapping=owners)
+                pipe.zadd(seen_key, seen)
+                for name in (key, owners_key, seen_key):
+                    pipe.expire(name, self.ttl)
+            await pipe.execute()
+
+    async def remove_member(self, group_id: str, user_id: int, owner: str) -> bool:
+        return bool(await self._remove(keys=self._keys(group_id), args=[str(user_id), owner]))
+
+    async def get_members(self, group_id: str) -> list[dict]:
+        cutoff = self._cutoff()
+        # Lua has no infinity literal, and nothing was written before the epoch
+        values = await self._read(keys=self._keys(group_id), args=[max(cutoff, 0)])
+        return [json.loads(value) for value in values]
+
+
+def get_client_manager(url: str | None, channel: str = "group_maps"):
+    """
+    Socket.IO client manager for `url`, None keeps the default in-process one.
+    """
+
+    if not url:
+        return None
+
+    if url.startswith("memory://"):
+        return LoopbackManager(channel=channel)
+
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisManager(url, channel=channel)
+
+    if url.startswith(("amqp://", "amqps://")):
+        return AioPikaManager(url, channel=channel)
+
+    raise ValueError(f"Unsupported realtime backend: {url}")
+
+
+def get_state_backend(url: str | None, member_ttl: float = 0) -> StateBackend:
+    if not url or url.startswith("memory://"):
+        return MemoryStateBackend(member_ttl=member_ttl)
+
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateBackend(url, member_ttl=member_ttl)
+
+    raise ValueError(f"Unsupported realtime state backend: {url}")
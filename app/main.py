@@ -1,26 +1,49 @@
+from contextlib import asynccontextmanager
+import secrets
 from typing import Annotated
-from fastapi import APIRouter, Depends, FastAPI, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException, WebSocket, WebSocketDisconnect, status
 from fastapi.routing import APIRoute
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 import jwt
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest, start_http_server
 from pydantic import ValidationError
 import socketio
-from app.core import security
+from app.core import metrics, security
 from app.models import UserModel
 from app.core.config import settings
+from app.core.loop_monitor import loop_monitor
+from app.middlewares.metrics import MetricsMiddleware
 from app.routers import auth, group, user
 from app.utils.deps import CurrentUser, SessionDep, get_current_user
-from app.socket_manager import sio
+from app.socket_manager import manager, sio
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
     return f"{route.tags[0]}-{route.name}"
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    metrics_server = None
+    if settings.METRICS_ENABLED and settings.METRICS_PORT:
+        metrics_server, _ = start_http_server(settings.METRICS_PORT, registry=metrics.registry)
+
+    loop_monitor.start()
+    manager.start()
+    yield
+    await manager.stop()
+    loop_monitor.stop()
+
+    if metrics_server is not None:
+        metrics_server.shutdown()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    lifespan=lifespan,
 )
 
 
@@ -32,6 +55,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, route_name=custom_generate_unique_id)
+
+if settings.METRICS_ENABLED and settings.METRICS_TOKEN:
+
+    @app.get("/metrics", tags=["metrics"], include_in_schema=False)
+    def get_metrics(authorization: Annotated[str | None, Header()] = None):
+        """
+        Prometheus metrics, for scrapers sending `METRICS_TOKEN` as a bearer token.
+        """
+
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        if authorization is None or not secrets.compare_digest(authorization.encode(), expected.encode()):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, headers={"WWW-Authenticate": "Bearer"})
+
+        return Response(generate_latest(metrics.registry), media_type=CONTENT_TYPE_LATEST)
+
 api_router = APIRouter(prefix=settings.API_V1_STR)
 
 api_router.include_router(auth.router)
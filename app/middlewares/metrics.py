@@ -0,0 +1,64 @@
+import time
+from typing import Callable
+
+from fastapi.routing import APIRoute
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import metrics
+
+
+class MetricsMiddleware:
+    """
+    Records the latency of every REST request, labelled with the route name
+    given by `route_name` (the app's unique id function) instead of the raw
+    path, so path parameters do not create new series.
+    """
+
+    def __init__(self, app: ASGIApp, route_name: Callable[[APIRoute], str]):
+        self.app = app
+        self.route_name = route_name
+        # Routes are not hashable, their ids are stable for the app's lifetime
+        self._names: dict[int, str] = {}
+
+    def _label(self, scope: Scope) -> str:
+        route = scope.get("route")
+
+        # Older Starlette versions only expose the matched endpoint
+        if route is None:
+            route = next(
+                (
+                    candidate
+                    for candidate in scope["app"].routes
+                    if getattr(candidate, "endpoint", None) is scope.get("endpoint")
+                ),
+                None,
+            )
+
+        if not isinstance(route, APIRoute):
+            return "other"
+
+        name = self._names.get(id(route))
+        if name is None:
+            name = self._names[id(route)] = self.route_name(route)
+        return name
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.http_request_duration.labels(self._label(scope), scope["method"], status).observe(
+                time.perf_counter() - start
+            )
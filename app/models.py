@@ -1,9 +1,12 @@
 from random import randbytes
+from secrets import token_hex
 from typing import Optional
 from uuid import uuid4
 from zoneinfo import ZoneInfo
 from sqlalchemy.orm import Session, InstrumentedAttribute
-from sqlalchemy import MetaData, ForeignKey, Integer, BigInteger, UUID, DateTime, UniqueConstraint, JSON, select
+from sqlalchemy import MetaData, ForeignKey, Index, Integer, BigInteger, UUID, DateTime, UniqueConstraint, JSON, delete, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import mapped_column, relationship, Mapped, DeclarativeBase, MappedAsDataclass
 from datetime import datetime, date, timedelta
 from app.enums import *
@@ -14,34 +17,130 @@ from app.core.config import settings
 
 my_metadata = MetaData()
 
+GROUP_CODE_LENGTH = 6
+
+_dialect_inserts = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
 class Base(DeclarativeBase):
 
     @classmethod
-    def all(cls, db_session: Session):
-        return db_session.scalars(select(cls)).all()
+    def _select(cls, only=None, options=(), **kwargs):
+        """
+        `only` selects the given fields instead of whole instances, rows are
+        returned then. `options` are loader options such as `selectinload`.
+        """
 
-    @classmethod
-    def filter(cls, db_session: Session, **kwargs):
-        stmt = select(cls)
+        stmt = select(*[getattr(cls, field) for field in only]) if only else select(cls)
         for field, value in kwargs.items():
             stmt = stmt.where(getattr(cls, field) == value)
-        return db_session.scalars(stmt).all()
+        return stmt.options(*options)
+
+    @classmethod
+    def _fetch(cls, db_session: Session, stmt, only=None):
+        return db_session.execute(stmt) if only else db_session.scalars(stmt)
+
+    @classmethod
+    def all(cls, db_session: Session, *, only=None, options=()):
+        return cls._fetch(db_session, cls._select(only, options), only).all()
+
+    @classmethod
+    def filter(cls, db_session: Session, *, only=None, options=(), **kwargs):
+        return cls._fetch(db_session, cls._select(only, options, **kwargs), only).all()
 
     @classmethod
-    def first(cls, db_session: Session, **kwargs):
-        stmt = select(cls)
+    def first(cls, db_session: Session, *, only=None, options=(), **kwargs):
+        return cls._fetch(db_session, cls._select(only, options, **kwargs), only).first()
+
+    @classmethod
+    def bulk_create(cls, db_session: Session, rows: list[dict], commit: bool = True):
+        """
+        Inserts `rows` with multi-row INSERT statements, without building
+        instances.
+        """
+
+        if rows:
+            db_session.execute(insert(cls), rows)
+        if commit:
+            db_session.commit()
+
+    @classmethod
+    def bulk_update(cls, db_session: Session, rows: list[dict], commit: bool = True):
+        """
+        Updates `rows` by primary key, each dict holds the primary key and the
+        fields to set. Sent as a single executemany.
+        """
+
+        if rows:
+            db_session.execute(update(cls), rows)
+        if commit:
+            db_session.commit()
+
+    @classmethod
+    def upsert(
+        cls,
+        db_session: Session,
+        rows: list[dict],
+        index_elements: list[str],
+        update_fields: list[str] | None = None,
+        commit: bool = True,
+    ):
+        """
+        Inserts `rows`, on a conflict over `index_elements` updates
+        `update_fields` with the new values, or skips the row without them.
+        """
+
+        if rows:
+            stmt = _dialect_inserts[db_session.get_bind().dialect.name](cls)
+
+            if update_fields:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=index_elements,
+                    set_={field: stmt.excluded[field] for field in update_fields},
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+
+            db_session.execute(stmt, rows)
+        if commit:
+            db_session.commit()
+
+    @classmethod
+    def delete_where(cls, db_session: Session, *criteria, commit: bool = True, **kwargs) -> int:
+        """
+        Deletes the rows matching `criteria` and `kwargs` in one statement
+        and returns their count.
+        """
+
+        stmt = delete(cls).where(*criteria)
         for field, value in kwargs.items():
             stmt = stmt.where(getattr(cls, field) == value)
-        return db_session.scalars(stmt).first()
 
-    def save(self, db_session: Session):
+        result = db_session.execute(stmt, execution_options={"synchronize_session": False})
+        if commit:
+            db_session.commit()
+        return result.rowcount
+
+    def save(self, db_session: Session, commit: bool = True, refresh: bool = True):
+        """
+        With `commit=False` the row is only flushed, so several changes can
+        share one transaction. `refresh=False` skips reloading the row.
+        """
+
         db_session.add(self)
+        if not commit:
+            db_session.flush()
+            return
+
         db_session.commit()
-        db_session.refresh(self)
+        if refresh:
+            db_session.refresh(self)
 
-    def delete(self, db_session: Session):
+    def delete(self, db_session: Session, commit: bool = True):
         db_session.delete(self)
-        db_session.commit()
+        if commit:
+            db_session.commit()
+        else:
+            db_session.flush()
 
 
 
@@ -50,12 +149,29 @@ class UserModel(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
-    username: Mapped[str]
+    username: Mapped[str] = mapped_column(unique=True, index=True)
     password: Mapped[str]
 
     lat: Mapped[Optional[float]]
     long: Mapped[Optional[float]]
 
+    # Incremented whenever the set of groups of the user changes
+    groups_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    # Incremented on password changes, tokens issued with an older value are rejected
+    credentials_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+
+    @classmethod
+    def bump_groups_version(cls, db_session: Session, *criteria):
+        """
+        Increments `groups_version` of the users matching `criteria` in the
+        current transaction.
+        """
+
+        db_session.execute(
+            update(cls).where(*criteria).values(groups_version=cls.groups_version + 1),
+            execution_options={"synchronize_session": False},
+        )
+
 
 class WaypointModel(Base):
     __tablename__ = "waypoint"
@@ -67,6 +183,9 @@ class WaypointModel(Base):
     lat: Mapped[Optional[float]]
     long: Mapped[Optional[float]]
 
+    # Serves the per-group listing, in id order for keyset pagination
+    __table_args__ = (Index("ix_waypoint_group_id_id", "group_id", "id"),)
+
 
 class GroupModel(Base):
     __tablename__ = "group"
@@ -75,7 +194,10 @@ class GroupModel(Base):
     user_owner_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
 
     name: Mapped[str]
-    code: Mapped[str]
+    code: Mapped[str] = mapped_column(unique=True, index=True)
+
+    # Incremented on every waypoint change, see `bump_waypoint_version`
+    waypoint_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
 
     user_owner: Mapped[UserModel] = relationship(
         "UserModel", 
@@ -91,6 +213,39 @@ class GroupModel(Base):
         backref="group"
     )
 
+    @classmethod
+    def bump_waypoint_version(cls, db_session: Session, group_id: int) -> int:
+        """
+        Atomically increments the group's waypoint version in the current
+        transaction and returns the new value.
+        """
+
+        stmt = (
+            update(cls)
+            .where(cls.id == group_id)
+            .values(waypoint_version=cls.waypoint_version + 1)
+            .returning(cls.waypoint_version)
+        )
+        return db_session.scalar(stmt)
+
+    def save_with_code(self, db_session: Session, attempts: int = 5) -> bool:
+        """
+        Flushes the group with a random join code, drawing a new one while it
+        collides with an existing code. Returns False when all attempts
+        collided.
+        """
+
+        for _ in range(attempts):
+            self.code = token_hex(GROUP_CODE_LENGTH // 2)
+            try:
+                with db_session.begin_nested():
+                    db_session.add(self)
+            except IntegrityError:
+                continue
+            return True
+
+        return False
+
 
 class _UserGroupModel(Base):
     __tablename__ = "user_group"
@@ -99,5 +254,28 @@ class _UserGroupModel(Base):
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
     group_id: Mapped[int] = mapped_column(ForeignKey("group.id"))
 
-    __table_args__ = (UniqueConstraint("user_id", "group_id"),)
+    # The unique constraint also serves lookups by user, the index serves
+    # member listings of a group in user id order
+    __table_args__ = (
+        UniqueConstraint("user_id", "group_id"),
+        Index("ix_user_group_group_id_user_id", "group_id", "user_id"),
+    )
 
+
+class PositionHistoryModel(Base):
+    __tablename__ = "position_history"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id", ondelete="CASCADE"))
+    group_id: Mapped[int] = mapped_column(ForeignKey("group.id", ondelete="CASCADE"))
+    recorded_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+    lat: Mapped[float]
+    long: Mapped[float]
+
+    # Rows are appended in time order, so a BRIN index keeps time range
+    # scans cheap while the btree serves per-group track windows
+    __table_args__ = (
+        Index("ix_position_history_group_id_recorded_at", "group_id", "recorded_at"),
+        Index("ix_position_history_recorded_at", "recorded_at", postgresql_using="brin"),
+    )
@@ -3,9 +3,10 @@ import secrets
 from typing import Annotated, Any
 import base64
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
-from app.core.security import verify_password, create_access_token
+from app.core.security import create_access_token
 from app.core.config import settings
-from app.core.security import get_password_hash
+from app.core.security import PasswordHasherBusy, get_password_hash, password_hasher
+from app.core.database import run_in_db_executor
 from app.utils.deps import CurrentUser, SessionDep
 from urllib.parse import quote, urlencode
 from app.models import UserModel
@@ -16,22 +17,38 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @router.post("/login/access-token/")
-def login_access_token(
+async def login_access_token(
     db_session: SessionDep, payload: LoginSchema
 ) -> TokenSchema:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
     
-    user = UserModel.first(db_session=db_session, username=payload.username)
+    user = await run_in_db_executor(UserModel.first, db_session, username=payload.username)
 
-    if not user or not verify_password(payload.password, user.password):
+    if not user:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
+
+    try:
+        valid, new_hash = await password_hasher.verify_and_update(payload.password, user.password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=503, detail="Too many logins in progress, try again.", headers={"Retry-After": "1"}
+        )
+
+    if not valid:
+        raise HTTPException(status_code=401, detail="Incorrect username or password")
+
+    # Read before a commit expires them
+    user_id, version = user.id, user.credentials_version
+
+    # Hashed with an outdated cost, upgrade it while the password is known
+    if new_hash:
+        user.password = new_hash
+        await run_in_db_executor(user.save, db_session, refresh=False)
     
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     
     return TokenSchema(
-        access_token=create_access_token(
-            user.id, expires_delta=access_token_expires
-        )
+        access_token=create_access_token(user_id, expires_delta=access_token_expires, version=version)
     )
@@ -1,17 +1,26 @@
 import uuid
-import random
-from typing import Any, List
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Annotated, Any, List
+from anyio import from_thread
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status
 from pydantic import ValidationError
 from app.schemas.waypoint import WaypointCreateSchema, WaypointResponseSchema
 from app.utils.deps import CurrentUser, SessionDep
+from app.utils.etag import check_etag, make_etag
+from app.utils.pagination import paginate
 from app.core.config import settings
+from app.core.membership import membership
 from app.core.security import get_password_hash, verify_password
-from app.models import GroupModel, WaypointModel
+from app.models import GroupModel, PositionHistoryModel, UserModel, WaypointModel
 from app.schemas.misc import PaginatedList, Message
 from app.schemas.group import GroupCreateSchema, GroupResponseSchema
+from app.schemas.track import TrackPointSchema, TrackSchema
+from app.schemas.user import NearbyMemberSchema, NearbyQuerySchema, UserResponseSchema
+from sqlalchemy import func, literal_column, select
+from sqlalchemy.orm import joinedload
 
-from app.socket_manager import sio
+from app.socket_manager import manager
 
 router = APIRouter(prefix="/groups", tags=["groups"])
 
@@ -22,7 +31,14 @@ def create_group(*, db_session: SessionDep, current_user: CurrentUser, payload:
     Create new group.
     """
 
-    group = GroupModel(user_owner_id=current_user.id, code=f"{random.randbytes(32).hex()}"[:6], **payload.model_dump())
+    group = GroupModel(user_owner_id=current_user.id, **payload.model_dump())
+
+    if not group.save_with_code(db_session):
+        raise HTTPException(
+            status_code=503, detail="Could not generate a group code, try again."
+        )
+
+    UserModel.bump_groups_version(db_session, UserModel.id == current_user.id)
     group.users.add(current_user)
     group.save(db_session)
 
@@ -30,30 +46,47 @@ def create_group(*, db_session: SessionDep, current_user: CurrentUser, payload:
 
 
 @router.get("/{group_id}", response_model=GroupResponseSchema)
-def get(*, db_session: SessionDep, current_user: CurrentUser, group_id: int) -> Any:
+def get(*, db_session: SessionDep, current_user: CurrentUser, group_id: int, request: Request, response: Response) -> Any:
     """
     Get a group info.
     """
 
-    group = GroupModel.first(db_session, id=group_id)
-
-    if current_user not in group.users:
+    if not membership.is_member(db_session, current_user.id, group_id):
         raise HTTPException(
             status_code=403, detail="You do not have permission to perform this action."
         )
 
+    # Groups are not editable after creation, the id identifies the content
+    not_modified = check_etag(request, response, make_etag("group", group_id))
+    if not_modified:
+        return not_modified
+
+    group = GroupModel.first(db_session, id=group_id)
+
     return group
 
 
-@router.get("/me/", response_model=List[GroupResponseSchema])
-def get_me_groups(current_user: CurrentUser) -> Any:
+@router.get("/me/", response_model=PaginatedList[GroupResponseSchema])
+def get_me_groups(
+    *,
+    db_session: SessionDep,
+    current_user: CurrentUser,
+    request: Request,
+    response: Response,
+    limit: int = Query(default=settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX),
+    cursor: str | None = None,
+) -> Any:
     """
     Get groups of current user.
     """
 
-    groups = current_user.groups
+    # Read before the list, a concurrent change can only cause an extra 200
+    version = db_session.scalar(select(UserModel.groups_version).where(UserModel.id == current_user.id))
+    not_modified = check_etag(request, response, make_etag("groups", current_user.id, version, limit, cursor or ""))
+    if not_modified:
+        return not_modified
 
-    return groups
+    return paginate(db_session, membership.groups_of(current_user.id), GroupModel.id, limit, cursor)
 
 
 @router.post("/join/{group_code}", response_model=GroupResponseSchema)
@@ -64,8 +97,12 @@ def join_group(*, db_session: SessionDep, current_user: CurrentUser, group_code:
 
     group = GroupModel.first(db_session, code=group_code)
 
-    group.users.add(current_user)
-    group.save(db_session)
+    if not group:
+        raise HTTPException(
+            status_code=404, detail="Object not found."
+        )
+
+    membership.add(db_session, current_user.id, group.id)
 
     return group
 
@@ -77,15 +114,13 @@ def leave_group(*, db_session: SessionDep, current_user: CurrentUser,  group_id:
     """
 
 
-    group = GroupModel.first(db_session, id=group_id)
-
-    if current_user not in group.users:
+    if not membership.is_member(db_session, current_user.id, group_id):
         raise HTTPException(
             status_code=404, detail="Object not found."
         )
-    
-    group.users.remove(current_user)
-    group.save(db_session)
+
+    membership.remove(db_session, current_user.id, group_id)
+    group = GroupModel.first(db_session, id=group_id)
 
     return group
 
@@ -104,12 +139,12 @@ def delete(*, db_session: SessionDep, current_user: CurrentUser, group_id: int)
             status_code=404, detail="Object not found."
         )
     
-    if current_user != group.user_owner:
+    if current_user.id != group.user_owner_id:
         raise HTTPException(
             status_code=403, detail="You do not have permission to perform this action."
         )
     
-    group.delete(db_session)
+    membership.delete_group(db_session, group)
 
     return Message(message="Group successfully deleted.")
 
@@ -117,65 +152,206 @@ def delete(*, db_session: SessionDep, current_user: CurrentUser, group_id: int)
 
 
 @router.post("/{group_id}/waypoints/", response_model=WaypointResponseSchema)
-async def create_waypoint(*, db_session: SessionDep, current_user: CurrentUser, group_id: int, payload: WaypointCreateSchema) -> Any:
+def create_waypoint(*, db_session: SessionDep, current_user: CurrentUser, group_id: int, payload: WaypointCreateSchema) -> Any:
     """
     Create new waypoint in a group.
     """
 
-    waypoint = WaypointModel(group_id=group_id, **payload.model_dump())
-    waypoint.save(db_session)
+    if not membership.is_member(db_session, current_user.id, group_id):
+        raise HTTPException(
+            status_code=403, detail="You do not have permission to perform this action."
+        )
 
-    await sio.emit(
-        "update_waypoints",
-        data=[WaypointResponseSchema.model_validate(waypoint).model_dump() for waypoint in waypoint.group.waypoints],
-        to=str(waypoint.group_id)
+    waypoint = WaypointModel(group_id=group_id, **payload.model_dump())
+    waypoint.save(db_session, commit=False)
+    version = GroupModel.bump_waypoint_version(db_session, group_id)
+    db_session.commit()
+
+    # The route runs in a worker thread, emit from the event loop
+    from_thread.run(
+        manager.emit_group_event,
+        str(group_id),
+        "waypoint_added",
+        {"version": version, "waypoint": WaypointResponseSchema.model_validate(waypoint).model_dump()},
     )
 
     return waypoint
 
 
-@router.get("/{group_id}/waypoints/", response_model=List[WaypointResponseSchema])
-def get_waypoints(*, db_session: SessionDep, current_user: CurrentUser, group_id: int) -> Any:
+@router.get("/{group_id}/waypoints/", response_model=PaginatedList[WaypointResponseSchema])
+def get_waypoints(
+    *,
+    db_session: SessionDep,
+    current_user: CurrentUser,
+    group_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(default=settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX),
+    cursor: str | None = None,
+) -> Any:
     """
-    Get all waypoints of a group.
+    Get waypoints of a group.
     """
 
-    group = GroupModel.first(db_session, id=group_id)
-
-    if current_user not in group.users:
+    if not membership.is_member(db_session, current_user.id, group_id):
         raise HTTPException(
             status_code=403, detail="You do not have permission to perform this action."
         )
 
-    waypoints = group.waypoints
+    # Read before the list, so later deltas are never missed
+    version = db_session.scalar(select(GroupModel.waypoint_version).where(GroupModel.id == group_id))
+    response.headers["X-Waypoint-Version"] = str(version)
+
+    not_modified = check_etag(request, response, make_etag("waypoints", group_id, version, limit, cursor or ""))
+    if not_modified:
+        return not_modified
+
+    stmt = select(WaypointModel).where(WaypointModel.group_id == group_id)
 
-    return waypoints
+    return paginate(db_session, stmt, WaypointModel.id, limit, cursor)
 
 
 @router.delete("/waypoints/{waypoint_id}", response_model=Message)
-async def delete_waypoint(*, db_session: SessionDep, current_user: CurrentUser, waypoint_id: int) -> Any:
+def delete_waypoint(*, db_session: SessionDep, current_user: CurrentUser, waypoint_id: int) -> Any:
     """
     Delete a waypoint.
     """
 
-    waypoint = WaypointModel.first(db_session, id=waypoint_id)
+    waypoint = WaypointModel.first(db_session, options=[joinedload(WaypointModel.group)], id=waypoint_id)
 
     if not waypoint:
         raise HTTPException(
             status_code=404, detail="Object not found."
         )
 
-    if current_user != waypoint.group.user_owner:
+    if current_user.id != waypoint.group.user_owner_id:
         raise HTTPException(
             status_code=403, detail="You do not have permission to perform this action."
         )
-    
-    waypoint.delete(db_session)
 
-    await sio.emit(
-        "update_waypoints",
-        data=[WaypointResponseSchema.model_validate(waypoint).model_dump() for waypoint in waypoint.group.waypoints],
-        to=str(waypoint.group_id)
+    group_id = waypoint.group_id
+    version = GroupModel.bump_waypoint_version(db_session, group_id)
+    WaypointModel.delete_where(db_session, id=waypoint_id)
+
+    from_thread.run(
+        manager.emit_group_event, str(group_id), "waypoint_removed", {"version": version, "id": waypoint_id}
     )
 
     return Message(message="Waypoint successfully deleted.")
+
+
+@router.get("/{group_id}/members/", response_model=PaginatedList[UserResponseSchema])
+def get_members(
+    *,
+    db_session: SessionDep,
+    current_user: CurrentUser,
+    group_id: int,
+    limit: int = Query(default=settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX),
+    cursor: str | None = None,
+) -> Any:
+    """
+    Get members of a group.
+    """
+
+    if not membership.is_member(db_session, current_user.id, group_id):
+        raise HTTPException(
+            status_code=403, detail="You do not have permission to perform this action."
+        )
+
+    return paginate(db_session, membership.members_of(group_id), UserModel.id, limit, cursor)
+
+
+@router.get("/{group_id}/nearby", response_model=List[NearbyMemberSchema])
+def get_nearby(
+    *, db_session: SessionDep, current_user: CurrentUser, group_id: int, query: Annotated[NearbyQuerySchema, Query()]
+) -> Any:
+    """
+    Get live members of a group near a point or inside a bounding box.
+    """
+
+    if not membership.is_member(db_session, current_user.id, group_id):
+        raise HTTPException(
+            status_code=403, detail="You do not have permission to perform this action."
+        )
+
+    # The spatial index and the state backend belong to the event loop
+    return from_thread.run(
+        partial(
+            manager.nearby,
+            str(group_id),
+            lat=query.lat,
+            long=query.long,
+            radius=query.radius,
+            k=query.k,
+            bbox=query.bbox,
+        )
+    )
+
+
+@router.get("/{group_id}/tracks", response_model=List[TrackSchema])
+def get_tracks(
+    *,
+    db_session: SessionDep,
+    current_user: CurrentUser,
+    group_id: int,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    user_id: int | None = None,
+    max_points: int = Query(default=500, ge=2, le=5000),
+) -> Any:
+    """
+    Get members' tracks of a group in a time window, downsampled to at most
+    `max_points` points per member.
+    """
+
+    if not membership.is_member(db_session, current_user.id, group_id):
+        raise HTTPException(
+            status_code=403, detail="You do not have permission to perform this action."
+        )
+
+    # Naive datetimes are taken as UTC
+    if end and not end.tzinfo:
+        end = end.replace(tzinfo=timezone.utc)
+    if start and not start.tzinfo:
+        start = start.replace(tzinfo=timezone.utc)
+
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(hours=1)
+
+    if start >= end or end - start > timedelta(days=7):
+        raise HTTPException(
+            status_code=400, detail="The time window must be positive and at most 7 days long."
+        )
+
+    # Points are averaged into equal time buckets on the database side
+    step = (end - start).total_seconds() / max_points
+    bucket = func.floor(
+        (func.extract("epoch", PositionHistoryModel.recorded_at) - start.timestamp()) / step
+    ).label("bucket")
+
+    stmt = (
+        select(
+            PositionHistoryModel.user_id,
+            bucket,
+            func.min(PositionHistoryModel.recorded_at),
+            func.avg(PositionHistoryModel.lat),
+            func.avg(PositionHistoryModel.long),
+        )
+        .where(
+            PositionHistoryModel.group_id == group_id,
+            PositionHistoryModel.recorded_at >= start,
+            PositionHistoryModel.recorded_at < end,
+        )
+        .group_by(PositionHistoryModel.user_id, literal_column("bucket"))
+        .order_by(PositionHistoryModel.user_id, bucket)
+    )
+
+    if user_id is not None:
+        stmt = stmt.where(PositionHistoryModel.user_id == user_id)
+
+    tracks: dict[int, TrackSchema] = {}
+    for track_user_id, _, recorded_at, lat, long in db_session.execute(stmt):
+        track = tracks.setdefault(track_user_id, TrackSchema(user_id=track_user_id, points=[]))
+        track.points.append(TrackPointSchema(recorded_at=recorded_at, lat=lat, long=long))
+
+    return list(tracks.values())
@@ -2,14 +2,16 @@ import uuid
 from typing import Any
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
 from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
 from app.utils.deps import CurrentUser, SessionDep
 from app.core.config import settings
-from app.core.security import get_password_hash, verify_password
+from app.core.database import run_in_db_executor
+from app.core.security import PasswordHasherBusy, password_hasher
 from app.models import UserModel
 from app.schemas.misc import PaginatedList, Message
 from app.schemas.user import UserLocationSchema, UserPasswordSchema, UserCreateSchema, UserResponseSchema
 
-from app.socket_manager import sio
+from app.socket_manager import revoke_user_tokens, sio
 
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -19,12 +21,12 @@ router = APIRouter(prefix="/users", tags=["users"])
     "/", 
     response_model=UserResponseSchema
 )
-def create_user(*, db_session: SessionDep, payload: UserCreateSchema) -> Any:
+async def create_user(*, db_session: SessionDep, payload: UserCreateSchema) -> Any:
     """
     Create new user.
     """
 
-    user = UserModel.filter(db_session, username=payload.username)
+    user = await run_in_db_executor(UserModel.first, db_session, only=["id"], username=payload.username)
 
     if user:
         raise HTTPException(
@@ -33,31 +35,59 @@ def create_user(*, db_session: SessionDep, payload: UserCreateSchema) -> Any:
         )
     
     user = UserModel(**payload.model_dump())
-    user.password = get_password_hash(payload.password)
 
-    user.save(db_session)
+    try:
+        user.password = await password_hasher.hash(payload.password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=503, detail="Too many signups in progress, try again.", headers={"Retry-After": "1"}
+        )
+
+    try:
+        await run_in_db_executor(user.save, db_session)
+    except IntegrityError:
+        # Lost a race against a concurrent signup with the same username
+        raise HTTPException(
+            status_code=409,
+            detail="This username is already in use.",
+        )
 
     return user
 
 
 @router.patch("/me/password/", response_model=Message)
-def update_password_me(
+async def update_password_me(
     *, db_session: SessionDep, payload: UserPasswordSchema, current_user: CurrentUser
 ) -> Any:
     """
     Update own password.
     """
 
-    if not verify_password(payload.current_password, current_user.password):
-        raise HTTPException(status_code=400, detail="Incorrect password")
-    
-    if payload.current_password == payload.new_password:
+    # Not loaded for cached tokens, so it may need a query
+    current_hash = await run_in_db_executor(getattr, current_user, "password")
+    # Read before the commit expires it
+    user_id = current_user.id
+
+    try:
+        if not await password_hasher.verify(payload.current_password, current_hash):
+            raise HTTPException(status_code=400, detail="Incorrect password")
+
+        if payload.current_password == payload.new_password:
+            raise HTTPException(
+                status_code=400, detail="New password cannot be the same as the current one."
+            )
+
+        new_password = await password_hasher.hash(payload.new_password)
+    except PasswordHasherBusy:
         raise HTTPException(
-            status_code=400, detail="New password cannot be the same as the current one."
+            status_code=503, detail="Too many password changes in progress, try again.", headers={"Retry-After": "1"}
         )
-    
-    current_user.password = get_password_hash(payload.new_password)
-    current_user.save(db_session)
+
+    current_user.password = new_password
+    # Revokes every token issued before, on all workers
+    current_user.credentials_version += 1
+    await run_in_db_executor(current_user.save, db_session, refresh=False)
+    await revoke_user_tokens(user_id)
 
     return Message(message="Password updated successfully.")
 
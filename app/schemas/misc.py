@@ -15,6 +15,8 @@ class PaginatedList(OrmBaseSchema, Generic[PaginatedT]):
     data: list[PaginatedT]
 
     current_page: int = Field(default=1, ge=1)
+    # Keyset pagination cursor of the next page
+    next_cursor: Optional[str] = None
 
 
     @computed_field(return_type=Optional[int])
@@ -0,0 +1,14 @@
+from datetime import datetime
+from typing import List
+from ._base import OrmBaseSchema
+
+
+class TrackPointSchema(OrmBaseSchema):
+    recorded_at: datetime
+    lat: float
+    long: float
+
+
+class TrackSchema(OrmBaseSchema):
+    user_id: int
+    points: List[TrackPointSchema]
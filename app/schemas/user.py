@@ -1,6 +1,8 @@
 from datetime import datetime
 from typing import Optional
 from uuid import UUID
+from pydantic import ConfigDict, Field, model_validator
+from pydantic_core import PydanticCustomError
 from ._base import OrmBaseSchema
 
 
@@ -24,3 +26,77 @@ class UserPasswordSchema(OrmBaseSchema):
 class UserLocationSchema(OrmBaseSchema):
     lat: Optional[float]
     long: Optional[float]
+
+
+class PositionUpdateSchema(OrmBaseSchema):
+    """
+    Position sent by a socket. The sender is the authenticated user, so an
+    `id` or `username` left in the payload is ignored.
+    """
+
+    model_config = ConfigDict(strict=True, extra="forbid")
+
+    lat: Optional[float] = Field(ge=-90, le=90)
+    long: Optional[float] = Field(ge=-180, le=180)
+    # Seconds since the epoch
+    timestamp: Optional[float] = Field(default=None, gt=0)
+
+    @model_validator(mode="before")
+    @classmethod
+    def drop_identity(cls, data):
+        if isinstance(data, dict) and ("id" in data or "username" in data):
+            return {key: value for key, value in data.items() if key not in ("id", "username")}
+
+        return data
+
+
+class NearbyQuerySchema(OrmBaseSchema):
+    lat: Optional[float] = Field(default=None, ge=-90, le=90)
+    long: Optional[float] = Field(default=None, ge=-180, le=180)
+    radius: Optional[float] = Field(default=None, gt=0, le=1_000_000)
+    k: Optional[int] = Field(default=None, ge=1, le=500)
+
+    south: Optional[float] = Field(default=None, ge=-90, le=90)
+    west: Optional[float] = Field(default=None, ge=-180, le=180)
+    north: Optional[float] = Field(default=None, ge=-90, le=90)
+    east: Optional[float] = Field(default=None, ge=-180, le=180)
+
+    @property
+    def bbox(self) -> Optional[tuple[float, float, float, float]]:
+        if self.south is None:
+            return None
+
+        return self.south, self.west, self.north, self.east
+
+    @model_validator(mode="after")
+    def is_valid_query(self):
+        bbox = [self.south, self.west, self.north, self.east]
+
+        if any(value is not None for value in bbox):
+            if any(value is None for value in bbox):
+                raise PydanticCustomError("bbox_error", "south, west, north and east are required together")
+            if self.south > self.north:
+                raise PydanticCustomError("bbox_error", "south must not be greater than north")
+            return self
+
+        if self.lat is None or self.long is None:
+            raise PydanticCustomError("nearby_query_error", "lat and long are required without a bounding box")
+
+        if self.radius is None and self.k is None:
+            raise PydanticCustomError("nearby_query_error", "radius or k is required")
+
+        return self
+
+
+class InterestSchema(NearbyQuerySchema):
+
+    @model_validator(mode="after")
+    def is_valid_area(self):
+        if self.bbox is None and self.radius is None:
+            raise PydanticCustomError("interest_error", "radius is required without a bounding box")
+
+        return self
+
+
+class NearbyMemberSchema(UserResponseSchema):
+    distance: Optional[float] = None
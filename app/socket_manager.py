@@ -1,144 +1,1079 @@
 import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from itertools import islice
+from secrets import token_hex
 import jwt
 import socketio
-from app.core import security
-from app.models import UserModel
+from pydantic import ValidationError
+from app.core import metrics, security
+from app.core.auth_cache import token_cache
+from app.core.membership import membership
+from app.models import GroupModel, UserModel, WaypointModel
 from app.core.config import settings
-from app.schemas.user import UserResponseSchema
-from app.core.database import engine
-from sqlalchemy.orm import Session
+from app.schemas.user import InterestSchema, NearbyQuerySchema, PositionUpdateSchema, UserResponseSchema
+from app.schemas.waypoint import WaypointResponseSchema
+from app.core.database import SessionLocal, run_in_db_executor
+from app.core.persistence import HistoryWriter, PositionWriter
+from app.core.realtime_backend import StateBackend, get_client_manager, get_state_backend, publish_internal
+from app.utils.codec import encode_positions, pack_position
+from app.utils.geo import Area, GridIndex, is_valid_position
+from app.utils.movement import MovementFilter
+from app.utils.outbound import LatestWinsQueue, TransportBacklog
+from app.utils.ratelimit import TokenBucketLimiter
+from app.utils.scheduler import Timer, TimerWheel
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from sqlalchemy import select
 
-sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*")
+logger = logging.getLogger(__name__)
+
+# Buffered under one name, whether sent alone or batched
+POSITION_EVENT = "server_update_position"
+
+sio = socketio.AsyncServer(
+    async_mode="asgi",
+    cors_allowed_origins="*",
+    max_http_buffer_size=settings.SOCKET_MAX_MESSAGE_SIZE,
+    client_manager=get_client_manager(settings.REALTIME_BACKEND_URL),
+)
 
 class PositionManager:
 
-    def __init__(self, sio: socketio.AsyncServer):
+    def __init__(self, sio: socketio.AsyncServer, backend: StateBackend):
         self.sio = sio
+        self.backend = backend
         self._storage: dict[str, dict] = {} 
         self._sid_map: dict[int, str] = {} 
-        self._disconnect_tasks: dict[int, asyncio.Task] = {}
+        self._sid_groups: dict[str, list[str]] = {}
+        # Grace period timers by user id, stale position timers by sid
+        self._disconnect_timers: dict[int, Timer] = {}
+        self._stale_timers: dict[str, Timer] = {}
+        # Suppressed positions waiting to be sent, by user id, with their due time
+        self._held_timers: dict[int, tuple[float, Timer]] = {}
+        # Members updated since the last write to the state backend, (group id, user id) -> sid
+        self._dirty_members: dict[tuple[str, int], str] = {}
+        self.scheduler = TimerWheel(tick=settings.SCHEDULER_TICK)
+        self._indexes: dict[str, GridIndex] = {}
+        self._interests: dict[str, dict[str, Area]] = {}
+        # Groups each sid has an interest in, which outlive its membership
+        self._interest_groups: dict[str, list[str]] = {}
+        self._binary: set[str] = set()
+        self._sequences: dict[str, int] = {}
+        # Recent (seq, event, data) of each group, replayed to resuming sockets
+        self._buffers: dict[str, deque] = {}
+        self.buffer_size = settings.RESUME_BUFFER_SIZE
+        # Sequences are only meaningful to the process that assigned them
+        self.epoch = token_hex(4)
+        # Sockets behind on their transport, with the position updates they wait for
+        self._outbound: dict[str, LatestWinsQueue] = {}
+        self._transport_backlog = TransportBacklog(sio)
+        self._max_backlog = 0
+
+        self.tick_rate = settings.POSITION_TICK_RATE
+        self._pending_positions: dict[str, dict[int, dict]] = {}
+        self._tick_task: asyncio.Task | None = None
+
+        self.limiter = TokenBucketLimiter(rate=settings.POSITION_RATE_LIMIT, burst=settings.POSITION_RATE_BURST)
+
+        self.movement = MovementFilter(
+            min_distance=settings.POSITION_MIN_DISTANCE,
+            min_interval=settings.POSITION_MIN_INTERVAL,
+            keepalive=settings.POSITION_KEEPALIVE_INTERVAL,
+        )
+
+        self.writer = PositionWriter(
+            interval=settings.POSITION_FLUSH_INTERVAL,
+            batch_size=settings.POSITION_FLUSH_BATCH_SIZE,
+            max_attempts=settings.POSITION_FLUSH_MAX_ATTEMPTS,
+        )
+        self.history = HistoryWriter(
+            interval=settings.POSITION_HISTORY_FLUSH_INTERVAL,
+            batch_size=settings.POSITION_HISTORY_BATCH_SIZE,
+            max_pending=settings.POSITION_HISTORY_MAX_PENDING,
+            max_attempts=settings.POSITION_FLUSH_MAX_ATTEMPTS,
+        )
+
+    def start(self):
+        self.scheduler.start()
+        if settings.REALTIME_STATE_FLUSH_INTERVAL > 0:
+            self.scheduler.every(settings.REALTIME_STATE_FLUSH_INTERVAL, self.flush_members)
+        if self.backend.member_ttl > 0:
+            self.scheduler.every(self.backend.member_ttl / 3, self.refresh_members)
+        if settings.OUTBOUND_HIGH_WATERMARK > 0:
+            self.scheduler.every(settings.OUTBOUND_CHECK_INTERVAL, self.check_outbound)
+
+        self.writer.start()
+        if settings.POSITION_HISTORY_ENABLED:
+            self.history.start()
+
+    async def stop(self):
+        if self._tick_task:
+            self._tick_task.cancel()
+            self._tick_task = None
+            await self.flush_positions()
+
+        # Members of this worker would otherwise stay in shared rosters
+        # until they expire
+        try:
+            await self.remove_users(list(self._storage))
+        except Exception:
+            logger.exception("Error removing members on shutdown")
+
+        await self.scheduler.stop()
+        await self.writer.stop()
+        await self.history.stop()
+
+
+    async def join(
+        self, sid: str, group_id: str, data: dict, binary: bool = False, resume: tuple[str, int] | None = None
+    ):
+        # A reconnect within the grace period, or a second socket, replaces a
+        # member the group already has
+        old_sid = self._sid_map.get(data.get("id"))
+        was_live = old_sid is not None and group_id in self.get_groups(old_sid)
 
+        await self.sio.enter_room(sid, group_id)
+        # Position updates are sent to a per-format room of the group
+        if binary:
+            self._binary.add(sid)
+            await self.sio.enter_room(sid, f"{group_id}:bin")
+        else:
+            await self.sio.enter_room(sid, f"{group_id}:json")
 
-    def set_user(self, sid: str, data: dict):
+        self._sid_groups.setdefault(sid, []).append(group_id)
+        await self.set_user(sid, data)
+        # Rosters, here and on other workers, include the new member right away
+        await self.flush_members()
+
+        # Only the joining socket needs the whole roster, or what it missed
+        # since `resume`, the others get the new member
+        if resume is None or not await self.send_missed(sid, group_id, *resume):
+            await self.send_roster(sid, group_id)
+        if not was_live:
+            await self.emit_group_event(group_id, "member_joined", data, skip_sid=sid)
+
+    async def set_user(self, sid: str, data: dict):
         user_id = data.get("id")
         old_sid = self._sid_map.get(user_id)
 
         if old_sid and old_sid != sid:
             self._storage.pop(old_sid, None)
+            self._sid_groups.pop(old_sid, None)
+            self._binary.discard(old_sid)
 
         self._sid_map[user_id] = sid
         self._storage[sid] = data
 
-        task = self._disconnect_tasks.pop(user_id, None)
-        if task and not task.done():
-            task.cancel()
+        timer = self._disconnect_timers.pop(user_id, None)
+        if timer:
+            timer.cancel()
+
+        if settings.POSITION_STALE_AFTER > 0:
+            timer = self._stale_timers.pop(sid, None)
+            if timer:
+                timer.cancel()
+            self._stale_timers[sid] = self.scheduler.schedule(
+                settings.POSITION_STALE_AFTER, self.expire_positions, sid
+            )
+
+        for group_id in self.get_groups(sid):
+            self._index_position(group_id, user_id, data)
+            self._dirty_members[(group_id, user_id)] = sid
+
+        if settings.REALTIME_STATE_FLUSH_INTERVAL <= 0:
+            await self.flush_members()
+
+    async def refresh_members(self):
+        """
+        Rewrite every local member, so members of idle users do not expire
+        from the state backend.
+        """
+
+        for sid, groups in self._sid_groups.items():
+            data = self._storage.get(sid)
+            if data is None:
+                continue
+
+            for group_id in groups:
+                self._dirty_members.setdefault((group_id, data.get("id")), sid)
+
+        await self.flush_members()
+
+    async def flush_members(self):
+        """
+        Write the members updated since the last flush to the state backend,
+        with the latest data of each, in one batch.
+        """
+
+        if not self._dirty_members:
+            return
+
+        dirty, self._dirty_members = self._dirty_members, {}
+        members = []
+
+        for (group_id, user_id), sid in dirty.items():
+            data = self._storage.get(sid)
+            # Removed meanwhile, the member must not be written back
+            if data is not None and group_id in self.get_groups(sid):
+                members.append((group_id, user_id, data, self._owner(sid)))
+
+        if not members:
+            return
+
+        try:
+            await self.backend.set_members(members)
+        except Exception:
+            # Retried on the next flush, unless updated again meanwhile
+            for key, sid in dirty.items():
+                self._dirty_members.setdefault(key, sid)
+            raise
+
+    def _owner(self, sid: str) -> str:
+        return f"{self.epoch}:{sid}"
 
     def get_user(self, sid: str):
         return self._storage.get(sid)
 
     def get_user_sid(self, user_id: int):
         return self._sid_map.get(user_id)
+
+    def get_groups(self, sid: str) -> list[str]:
+        return self._sid_groups.get(sid, [])
+
+    def _index_position(self, group_id: str, user_id: int, data: dict):
+        lat, long = data.get("lat"), data.get("long")
+
+        if is_valid_position(lat, long):
+            if group_id not in self._indexes:
+                self._indexes[group_id] = GridIndex(settings.SPATIAL_CELL_SIZE)
+            self._indexes[group_id].update(user_id, lat, long)
+        else:
+            self._unindex_position(group_id, user_id)
+
+    def _unindex_position(self, group_id: str, user_id: int):
+        index = self._indexes.get(group_id)
+        if index is None:
+            return
+
+        index.remove(user_id)
+        if not len(index):
+            self._indexes.pop(group_id, None)
+
+    async def nearby(
+        self,
+        group_id: str,
+        lat: float | None = None,
+        long: float | None = None,
+        radius: float | None = None,
+        k: int | None = None,
+        bbox: tuple[float, float, float, float] | None = None,
+    ) -> list[dict]:
+        """
+        Live members of a group, by proximity.
+
+        Either a `bbox` (south, west, north, east), or a point with a
+        `radius` in metres and/or `k` nearest members.
+
+        With a message bus the group spans workers, so the search runs over
+        the roster of the state backend, where members of other workers are
+        as recent as their last flush.
+        """
+
+        if isinstance(self.sio.manager, AsyncPubSubManager):
+            members = {member.get("id"): member for member in await self.backend.get_members(group_id)}
+            # Members connected here are newer than their last flush
+            for user_id in members:
+                sid = self._sid_map.get(user_id)
+                if sid in self._storage and group_id in self.get_groups(sid):
+                    members[user_id] = self._storage[sid]
+
+            index = GridIndex(settings.SPATIAL_CELL_SIZE)
+            for user_id, member in members.items():
+                if is_valid_position(member.get("lat"), member.get("long")):
+                    index.update(user_id, member["lat"], member["long"])
+            lookup = members.get
+        else:
+            index = self._indexes.get(group_id)
+            lookup = lambda user_id: self._storage.get(self._sid_map.get(user_id))
+
+        if not index:
+            return []
+
+        if bbox is not None:
+            matches = [(user_id, None) for user_id in index.bbox(*bbox)]
+        elif radius is not None:
+            matches = index.radius(lat, long, radius)
+            if k is not None:
+                matches = matches[:k]
+        else:
+            matches = index.nearest(lat, long, k)
+
+        result = []
+        for user_id, distance in matches:
+            data = lookup(user_id)
+            if data:
+                result.append({**data, "distance": distance})
+
+        return result
     
     def commit(self, user_data):
         user_id = user_data.get("id")
         if not user_id:
             return
-        
-        with Session(engine) as db_session:
-            user = UserModel.first(db_session, id=user_id)
-            if user:
-                user.lat = user_data.get("lat")
-                user.long = user_data.get("long")
-                user.save(db_session)
+
+        self.writer.mark(user_id, user_data.get("lat"), user_data.get("long"))
 
 
     async def update_position(self, sid: str, data: dict):
-        self.set_user(sid, data)
-        rooms = list(self.sio.rooms(sid))
-        await self.sio.emit("server_update_position", data=data, to=rooms)
+        for group_id in self.get_groups(sid):
+            metrics.position_updates.labels(group_id).inc()
 
+        await self.set_user(sid, data)
+        self.commit(data)
 
-    async def remove_user(self, sid: str, delay: int = 10):
-        try:
-            await asyncio.sleep(delay)
-        except:
+        if not self.should_broadcast(sid, data):
+            self.hold_position(data.get("id"))
             return
 
-        user_data = self._storage.pop(sid, None)
-        if not user_data:
+        self.record_history(sid, data)
+
+        if self.tick_rate > 0:
+            self.queue_position(sid, data)
             return
 
-        user_id = user_data.get("id")
-        if self._sid_map.get(user_id) == sid:
-            self._sid_map.pop(user_id, None)
+        for group_id in self.get_groups(sid):
+            await self.emit_positions(group_id, [data], batched=False)
 
-        try:
-            self.commit(user_data)
-        except Exception as e:
-            print(f"Error in commit user position: {e}")
-            
-        rooms = list(self.sio.rooms(sid))
-        await self.sio.emit("client_disconnect", data=user_data, to=rooms)
-    
+    def should_broadcast(self, sid: str, data: dict, held: bool = False) -> bool:
+        """
+        Whether the movement filter lets the position through. Each update
+        counts once as broadcast or suppressed, a held position counts again
+        as held only when it is sent.
+        """
 
-    def cancelable_remove_user(self, sid: str, delay: int = 10):
-        user_id = self.get_user(sid).get("id") if self.get_user(sid) else None
-        if not user_id:
+        lat, long = data.get("lat"), data.get("long")
+        if not self.movement.enabled or not is_valid_position(lat, long):
+            return True
+
+        broadcast = self.movement.should_broadcast(data.get("id"), lat, long, time.monotonic())
+        if held:
+            result = "held" if broadcast else None
+        else:
+            result = "broadcast" if broadcast else "suppressed"
+
+        if result:
+            for group_id in self.get_groups(sid):
+                metrics.position_broadcasts.labels(group_id, result).inc()
+
+        return broadcast
+
+    def hold_position(self, user_id: int):
+        """
+        Make sure the user's latest suppressed position goes out when it is
+        due, even if no further update arrives.
+        """
+
+        due = self.movement.held_until(user_id)
+        held = self._held_timers.get(user_id)
+        if due is None or (held and held[0] == due):
+            return
+
+        if held:
+            held[1].cancel()
+
+        timer = self.scheduler.schedule(due - time.monotonic(), self.flush_held, user_id)
+        self._held_timers[user_id] = (due, timer)
+
+    async def flush_held(self, user_ids: list[int]):
+        batches: dict[str, list[dict]] = {}
+
+        for user_id in user_ids:
+            self._held_timers.pop(user_id, None)
+            sid = self._sid_map.get(user_id)
+            data = self._storage.get(sid)
+            if not data:
+                continue
+
+            # Still too close to the last broadcast, wait for the keepalive
+            if not self.should_broadcast(sid, data, held=True):
+                self.hold_position(user_id)
+                continue
+
+            self.record_history(sid, data)
+            if self.tick_rate > 0:
+                self.queue_position(sid, data)
+            else:
+                for group_id in self.get_groups(sid):
+                    batches.setdefault(group_id, []).append(data)
+
+        for group_id, positions in batches.items():
+            await self.emit_positions(group_id, positions)
+
+    def record_history(self, sid: str, data: dict):
+        lat, long = data.get("lat"), data.get("long")
+        if not settings.POSITION_HISTORY_ENABLED or not is_valid_position(lat, long):
             return
 
-        task = asyncio.create_task(self.remove_user(sid, delay))
-        self._disconnect_tasks[user_id] = task
+        recorded_at = datetime.now(timezone.utc)
+        for group_id in self.get_groups(sid):
+            if group_id.isdigit():
+                self.history.add(data.get("id"), int(group_id), lat, long, recorded_at)
+
+    def queue_position(self, sid: str, data: dict):
+        user_id = data.get("id")
+
+        for group_id in self.get_groups(sid):
+            # Latest update wins inside a tick
+            self._pending_positions.setdefault(group_id, {})[user_id] = data
+
+        if not self._tick_task or self._tick_task.done():
+            self._tick_task = asyncio.create_task(self._tick_loop())
+
+    async def flush_positions(self):
+        pending, self._pending_positions = self._pending_positions, {}
+
+        for group_id, positions in pending.items():
+            await self.emit_positions(group_id, list(positions.values()))
+
+    async def emit_positions(self, group_id: str, positions: list[dict], batched: bool = True):
+        """
+        Send position updates to the JSON and binary subscribers of a group.
+        """
+
+        start = time.perf_counter()
+        interests = self._interests.get(group_id, {})
+        event = "server_update_positions" if batched else "server_update_position"
+
+        if batched:
+            # Sockets with an area of interest get their own filtered batch
+            skip_sid = list(interests)
+            targeted = {
+                sid: [position for position in positions if self._is_visible(area, position)]
+                for sid, area in interests.items()
+            }
+        else:
+            skip_sid = self._uninterested(group_id, positions[0]) or []
+            targeted = {}
+
+        # JSON events carry the last sequence as a second argument, binary
+        # records carry their own
+        sequences = {id(position): self._record(group_id, POSITION_EVENT, position) for position in positions}
+        seq = self._sequences[group_id]
+
+        # Slow consumers are left out, they get the latest of each member
+        # once they catch up
+        for sid, queue in self._outbound.items():
+            if group_id not in self.get_groups(sid):
+                continue
+
+            area = interests.get(sid)
+            for position in positions:
+                if area is None or self._is_visible(area, position):
+                    dropped = queue.put(group_id, position, sequences[id(position)])
+                    if dropped:
+                        metrics.outbound_drops.labels(dropped).inc()
+
+            targeted.pop(sid, None)
+            if sid not in interests:
+                skip_sid.append(sid)
+
+        skip_sid = skip_sid or None
+        packed: dict[int, bytes] = {}
+
+        def encode(items: list[dict]) -> bytes:
+            for item in items:
+                if id(item) not in packed:
+                    packed[id(item)] = pack_position(item, sequences[id(item)])
+            return encode_positions([packed[id(item)] for item in items])
+
+        await self.sio.emit(
+            event, data=(positions if batched else positions[0], seq), to=f"{group_id}:json", skip_sid=skip_sid
+        )
+        if self._has_participants(f"{group_id}:bin"):
+            await self.sio.emit(
+                "server_update_positions_bin", data=encode(positions), to=f"{group_id}:bin", skip_sid=skip_sid
+            )
+
+        for sid, visible in targeted.items():
+            if not visible:
+                continue
+
+            if sid in self._binary:
+                await self.sio.emit("server_update_positions_bin", data=encode(visible), to=sid)
+            else:
+                await self.sio.emit(event, data=(visible, seq), to=sid)
+
+        metrics.emit_duration.labels(event).observe(time.perf_counter() - start)
+
+    async def check_outbound(self):
+        """
+        Switch sockets behind on their transport to a latest-wins queue,
+        flush it once they caught up, and disconnect the ones that stay
+        behind for too long.
+        """
+
+        now = time.monotonic()
+        max_backlog = 0
+
+        for sid in list(self._storage):
+            backlog = self._transport_backlog(sid)
+            if backlog is None:
+                continue
+
+            max_backlog = max(max_backlog, backlog)
+            queue = self._outbound.get(sid)
+
+            if queue is None:
+                if backlog >= settings.OUTBOUND_HIGH_WATERMARK:
+                    self._outbound[sid] = LatestWinsQueue(settings.OUTBOUND_QUEUE_SIZE, now)
+            elif backlog <= settings.OUTBOUND_LOW_WATERMARK:
+                del self._outbound[sid]
+                await self.send_queued(sid, queue)
+            elif 0 < settings.SLOW_CONSUMER_TIMEOUT <= now - queue.since:
+                del self._outbound[sid]
+                metrics.slow_consumer_disconnects.inc()
+                await self.sio.disconnect(sid)
+
+        self._max_backlog = max_backlog
+
+    async def send_queued(self, sid: str, queue: LatestWinsQueue):
+        for group_id, items in queue.drain().items():
+            if sid in self._binary:
+                data = encode_positions([pack_position(position, seq) for seq, position in items])
+                await self.sio.emit("server_update_positions_bin", data=data, to=sid)
+            else:
+                # Other group events were not held back, so the socket is
+                # now up to date with the group
+                positions = [position for _, position in items]
+                await self.sio.emit(
+                    "server_update_positions", data=(positions, self._sequences.get(group_id, 0)), to=sid
+                )
+
+    def drop_outbound(self, sid: str):
+        self._outbound.pop(sid, None)
+
+    def _record(self, group_id: str, event: str, data) -> int:
+        """
+        Assign the next sequence number of the group to an event, and keep
+        it in the group's ring buffer.
+        """
+
+        seq = self._sequences[group_id] = self._sequences.get(group_id, 0) + 1
+
+        if self.buffer_size > 0:
+            buffer = self._buffers.get(group_id)
+            if buffer is None:
+                buffer = self._buffers[group_id] = deque(maxlen=self.buffer_size)
+            buffer.append((seq, event, data))
+
+        return seq
+
+    def missed_events(self, group_id: str, epoch: str, last_seq: int) -> list[dict] | None:
+        """
+        Events of the group after `last_seq`, with only the latest position
+        of each member. None when the gap is not fully buffered.
+        """
+
+        # Other workers record their own events, so no buffer is complete
+        if epoch != self.epoch or isinstance(self.sio.manager, AsyncPubSubManager):
+            return None
+
+        current = self._sequences.get(group_id, 0)
+        if last_seq == current:
+            return []
+
+        buffer = self._buffers.get(group_id)
+        if not buffer or not buffer[0][0] - 1 <= last_seq < current:
+            return None
+
+        missed = list(islice(buffer, last_seq - buffer[0][0] + 1, None))
+
+        latest = {data.get("id"): seq for seq, event, data in missed if event == POSITION_EVENT}
+        return [
+            {"seq": seq, "event": event, "data": data}
+            for seq, event, data in missed
+            if event != POSITION_EVENT or latest[data.get("id")] == seq
+        ]
+
+    def _has_members(self, group_id: str) -> bool:
+        # Sockets in their grace period still count, they may resume
+        return any(group_id in groups for groups in self._sid_groups.values())
+
+    def _has_participants(self, room: str) -> bool:
+        # Rooms on other workers are unknown when a message bus is used
+        if isinstance(self.sio.manager, AsyncPubSubManager):
+            return True
+
+        return bool(self.sio.manager.rooms.get("/", {}).get(room))
+
+    def set_interest(self, sid: str, area: Area):
+        self.clear_interest(sid)
+
+        groups = self._interest_groups[sid] = list(self.get_groups(sid))
+        for group_id in groups:
+            self._interests.setdefault(group_id, {})[sid] = area
+
+    def clear_interest(self, sid: str):
+        for group_id in self._interest_groups.pop(sid, ()):
+            interests = self._interests.get(group_id)
+            if interests is None:
+                continue
+
+            interests.pop(sid, None)
+            if not interests:
+                del self._interests[group_id]
+
+    @staticmethod
+    def _is_visible(area: Area, data: dict) -> bool:
+        lat, long = data.get("lat"), data.get("long")
+        return not is_valid_position(lat, long) or area.contains(lat, long)
+
+    def _uninterested(self, group_id: str, data: dict) -> list[str] | None:
+        interests = self._interests.get(group_id)
+        if not interests:
+            return None
+
+        return [sid for sid, area in interests.items() if not self._is_visible(area, data)]
+
+    async def _tick_loop(self):
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.tick_rate
+        deadline = loop.time()
+
+        while True:
+            deadline += interval
+            await asyncio.sleep(max(0, deadline - loop.time()))
+
+            try:
+                await self.flush_positions()
+            except Exception:
+                logger.exception("Error in flush positions")
+
+
+    def schedule_removal(self, sid: str, delay: float):
+        user_data = self.get_user(sid)
+        if not user_data or not user_data.get("id"):
+            return
+
+        self._disconnect_timers[user_data["id"]] = self.scheduler.schedule(delay, self.remove_users, sid)
+
+    async def remove_users(self, sids: list[str]):
+        """
+        Remove users whose grace period ran out, sending one disconnect
+        event per group for the whole batch.
+        """
+
+        departures: dict[str, list[dict]] = {}
+        left: set[str] = set()
+
+        # Members not written yet could not be removed by their owner. The
+        # timers of `sids` are spent, so local cleanup runs even if this fails
+        try:
+            await self.flush_members()
+        except Exception:
+            logger.exception("Error writing members before removing them")
+
+        for sid in sids:
+            user_data = self._storage.pop(sid, None)
+            rooms = self._sid_groups.pop(sid, [])
+            self._binary.discard(sid)
+
+            timer = self._stale_timers.pop(sid, None)
+            if timer:
+                timer.cancel()
+
+            if not user_data:
+                continue
+
+            user_id = user_data.get("id")
+            if self._sid_map.get(user_id) == sid:
+                self._sid_map.pop(user_id, None)
+                self._disconnect_timers.pop(user_id, None)
+                self.movement.forget(user_id)
+                self.limiter.forget(user_id)
+                held = self._held_timers.pop(user_id, None)
+                if held:
+                    held[1].cancel()
+
+            try:
+                self.commit(user_data)
+            except Exception as e:
+                print(f"Error in commit user position: {e}")
+
+            left.update(rooms)
+            for group_id in rooms:
+                self._unindex_position(group_id, user_id)
+                # A user who reconnected to another worker meanwhile owns
+                # the member now, and has not left
+                try:
+                    removed = await self.backend.remove_member(group_id, user_id, self._owner(sid))
+                except Exception:
+                    # Gone from here either way, the stored member expires
+                    logger.exception(f"Error removing member {user_id} of group {group_id}")
+                    removed = True
+
+                if removed:
+                    departures.setdefault(group_id, []).append(user_data)
+
+        # The sockets already left their rooms, so target the groups they were in
+        for group_id, users in departures.items():
+            if len(users) == 1:
+                await self.emit_group_event(group_id, "client_disconnect", users[0])
+            else:
+                await self.emit_group_event(group_id, "clients_disconnect", users)
+
+        for group_id in left:
+            # Per-group series only live while the group has local members
+            if not self.sio.manager.rooms.get("/", {}).get(group_id):
+                metrics.discard(metrics.position_updates, group_id)
+                metrics.discard(metrics.position_broadcasts, group_id, "broadcast")
+                metrics.discard(metrics.position_broadcasts, group_id, "suppressed")
+                metrics.discard(metrics.position_broadcasts, group_id, "held")
+
+            if not self._has_members(group_id):
+                self._buffers.pop(group_id, None)
+
+    async def expire_positions(self, sids: list[str]):
+        """
+        Drop positions that were not refreshed in time from the spatial
+        indexes, and tell each group which members went stale.
+        """
+
+        expired: dict[str, list[int]] = {}
+
+        for sid in sids:
+            self._stale_timers.pop(sid, None)
+            user_data = self._storage.get(sid)
+            if not user_data:
+                continue
+
+            for group_id in self.get_groups(sid):
+                self._unindex_position(group_id, user_data.get("id"))
+                expired.setdefault(group_id, []).append(user_data.get("id"))
+
+        for group_id, user_ids in expired.items():
+            await self.emit_group_event(group_id, "client_position_expired", user_ids)
+
+    async def emit_group_event(self, group_id: str, event: str, data, skip_sid: str | None = None):
+        seq = self._record(group_id, event, data)
+
+        start = time.perf_counter()
+        await self.sio.emit(event, data=(data, seq), to=group_id, skip_sid=skip_sid)
+        metrics.emit_duration.labels(event).observe(time.perf_counter() - start)
+
+    async def send_roster(self, sid: str, group_id: str):
+        """
+        Send the group's roster, kept by the state backend and written on
+        every join and leave, and in batches on updates, to a single socket.
+        """
+
+        # Events after this point may be replayed on top of the snapshot,
+        # which is harmless, earlier ones are in it
+        session = {"epoch": self.epoch, "seq": self._sequences.get(group_id, 0)}
+        data = await self.backend.get_members(group_id)
+
+        start = time.perf_counter()
+        await self.sio.emit("server_data", data=data, to=sid)
+        await self.sio.emit("server_session", data=session, to=sid)
+        metrics.emit_duration.labels("server_data").observe(time.perf_counter() - start)
+        metrics.socket_resumes.labels("snapshot").inc()
+
+    async def send_missed(self, sid: str, group_id: str, epoch: str, last_seq: int) -> bool:
+        """
+        Send a resuming socket the events it missed, False when they are
+        no longer buffered and a snapshot is needed.
+        """
+
+        events = self.missed_events(group_id, epoch, last_seq)
+        if events is None:
+            return False
+
+        data = {"epoch": self.epoch, "seq": self._sequences.get(group_id, 0), "events": events}
+
+        start = time.perf_counter()
+        await self.sio.emit("server_resume", data=data, to=sid)
+        metrics.emit_duration.labels("server_resume").observe(time.perf_counter() - start)
+        metrics.socket_resumes.labels("delta").inc()
+        return True
+
+    def room_sizes(self) -> dict[str, int]:
+        sizes: dict[str, int] = {}
+        for groups in self._sid_groups.values():
+            for group_id in groups:
+                sizes[group_id] = sizes.get(group_id, 0) + 1
+        return sizes
+
+    def buffer_stats(self) -> dict[str, int]:
+        return {
+            "groups": len(self._buffers),
+            "events": sum(len(buffer) for buffer in self._buffers.values()),
+            "size": self.buffer_size,
+        }
+
+    def outbound_stats(self) -> dict[str, int]:
+        depths = [len(queue) for queue in self._outbound.values()]
+        return {
+            "slow_sockets": len(depths),
+            "queued": sum(depths),
+            "max_depth": max(depths, default=0),
+            "max_transport_backlog": self._max_backlog,
+        }
+
+    def pending_disconnects(self) -> int:
+        return len(self._disconnect_timers)
 
-    async def broadcast_server_data(self, group_id):
-        clients = self.sio.manager.rooms.get("/", {}).get(group_id, set())
-        data = [self._storage.get(sid) for sid in clients if self._storage.get(sid)]
-        await self.sio.emit("server_data", data=data, to=group_id)
 
         
 
-manager = PositionManager(sio)
+manager = PositionManager(
+    sio,
+    get_state_backend(
+        settings.REALTIME_STATE_BACKEND_URL or settings.REALTIME_BACKEND_URL,
+        member_ttl=settings.REALTIME_MEMBER_TTL,
+    ),
+)
 
+metrics.register_gauge("room_members", "Local sockets in each group room.", manager.room_sizes, ["group"])
+metrics.register_gauge("active_groups", "Groups with local sockets.", lambda: len(manager.room_sizes()))
+metrics.register_gauge("connected_sockets", "Sockets with a live user.", lambda: len(manager._storage))
+metrics.register_gauge("pending_disconnects", "Disconnect timers not fired yet.", manager.pending_disconnects)
+metrics.register_gauge("scheduled_timers", "Timers pending on the scheduler wheel.", lambda: len(manager.scheduler))
+metrics.register_gauge("dirty_members", "Members waiting to be written to the state backend.", lambda: len(manager._dirty_members))
+metrics.register_gauge("held_positions", "Suppressed positions waiting for their keepalive.", lambda: len(manager._held_timers))
+
+for writer, prefix in ((manager.writer, "position_writer"), (manager.history, "history_writer")):
+    metrics.register_stats(
+        f"{writer.name.capitalize()} writer.",
+        writer.stats,
+        counters={
+            "flush_count": f"{prefix}_flushes",
+            "flush_errors": f"{prefix}_flush_errors",
+            "rows_written": f"{prefix}_rows_written",
+            "dropped": f"{prefix}_dropped_rows",
+            "total_flush_latency": f"{prefix}_flush_seconds",
+        },
+        gauges={
+            "pending": f"{prefix}_pending_rows",
+            "last_flush_latency": f"{prefix}_last_flush_seconds",
+            "max_flush_latency": f"{prefix}_max_flush_seconds",
+        },
+    )
+metrics.register_stats(
+    "Per-group event buffers for resuming sockets.",
+    manager.buffer_stats,
+    gauges={"groups": "resume_buffer_groups", "events": "resume_buffer_events"},
+)
+metrics.register_stats(
+    "Slow consumer queues and transport backlog.",
+    manager.outbound_stats,
+    gauges={
+        "slow_sockets": "slow_consumer_sockets",
+        "queued": "outbound_queued_positions",
+        "max_depth": "outbound_queue_max_depth",
+        "max_transport_backlog": "transport_backlog_max_packets",
+    },
+)
+metrics.register_stats(
+    "Position update rate limiter.",
+    manager.limiter.stats,
+    counters={"allowed": "position_rate_limit_allowed", "limited": "position_rate_limit_limited"},
+    gauges={"keys": "position_rate_limit_buckets"},
+)
+
+
+def parse_query(query: str) -> dict:
+    return dict(p.split("=", 1) for p in query.split("&") if "=" in p)
+
+
+def parse_resume(params: dict) -> tuple[str, int] | None:
+    """
+    `epoch` and `last_seq` of a reconnecting socket, as last received in
+    `server_session`, `server_resume` or an event's sequence argument.
+    """
+
+    epoch, last_seq = params.get("epoch"), params.get("last_seq")
+    if not epoch or not last_seq or not last_seq.isdigit():
+        return None
+
+    return epoch, int(last_seq)
+
+
+def parse_position(data) -> dict | None:
+    """
+    lat, long and optional timestamp of a position update, None when the
+    payload is invalid or its timestamp too far from the server clock.
+    """
 
-@sio.on("connect")
-async def connect(sid, environ, auth):
     try:
-        with Session(engine) as db_session:
-            query = environ.get("QUERY_STRING", "")
-            params = dict(p.split("=") for p in query.split("&") if "=" in p)
-            token = params.get("token")
-            group_id = params.get("group_id")
+        position = PositionUpdateSchema.model_validate(data)
+    except ValidationError:
+        return None
+
+    parsed = {"lat": position.lat, "long": position.long}
+    if position.timestamp is not None:
+        if abs(position.timestamp - time.time()) > settings.POSITION_TIMESTAMP_TOLERANCE:
+            return None
+        parsed["timestamp"] = position.timestamp
 
-            if not token or not group_id:
-                raise ValueError("Could not validate credentials.")
+    return parsed
 
+
+async def revoke_user_tokens(user_id: int):
+    """
+    Drops the cached tokens of `user_id` on every worker.
+    """
+
+    await publish_internal(sio.manager, "revoke_user_tokens", user_id)
+
+
+def authenticate(query: str) -> tuple[str, dict]:
+    params = parse_query(query)
+    token = params.get("token")
+    group_id = params.get("group_id")
+
+    if not token or not group_id:
+        raise ValueError("Could not validate credentials.")
+
+    group_id = int(group_id)
+
+    # Sessions connect lazily, cache hits never touch the database
+    with SessionLocal() as db_session:
+        user = token_cache.resolve(db_session, token)
+
+        if user is None:
             token_data = jwt.decode(
                 token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
             )
-            user_id = int(token_data.get("sub"))
-
-            user = UserModel.first(db_session, id=user_id)
+            user = UserModel.first(db_session, id=int(token_data.get("sub")))
 
             if not user:
                 raise ValueError("User not found.")
 
-            await sio.enter_room(sid, str(group_id))
-            manager.set_user(sid, UserResponseSchema.model_validate(user).model_dump())
-            await manager.broadcast_server_data(str(group_id))
-            
-            print(f"User {user.username} connected to group {group_id}.")
+            if user.credentials_version != token_data.get("ver", 0):
+                raise ValueError("Token was revoked.")
+
+            token_cache.set(token, user, expires_at=token_data["exp"])
+
+        if not membership.is_member(db_session, user.id, group_id):
+            raise ValueError("User is not a member of this group.")
+
+        return str(group_id), UserResponseSchema.model_validate(user).model_dump()
+
+
+def load_waypoints(group_id: int) -> dict:
+    with SessionLocal() as db_session:
+        # Read before the list, so later deltas are never missed
+        version = db_session.scalar(select(GroupModel.waypoint_version).where(GroupModel.id == group_id))
+        waypoints = WaypointModel.filter(db_session, only=["id", "name", "lat", "long"], group_id=group_id)
+
+        return {
+            "version": version,
+            "waypoints": [WaypointResponseSchema.model_validate(waypoint).model_dump() for waypoint in waypoints],
+        }
+
+
+@sio.on("connect")
+async def connect(sid, environ, auth):
+    try:
+        # Token decoding, DB lookup and validation stay off the event loop
+        group_id, user_data = await run_in_db_executor(
+            authenticate, environ.get("QUERY_STRING", "")
+        )
+
+        params = parse_query(environ.get("QUERY_STRING", ""))
+        await manager.join(
+            sid, group_id, user_data, binary=params.get("format") == "binary", resume=parse_resume(params)
+        )
+
+        metrics.socket_connects.inc()
+        print(f"User {user_data['username']} connected to group {group_id}.")
     except Exception as e:
+        metrics.socket_rejections.labels(type(e).__name__).inc()
         print(f"Error to connect: {e}")
         await sio.disconnect(sid)
 
 
 @sio.on("client_update_position")
 async def client_update(sid, data):
+    user = manager.get_user(sid)
+    if user is None:
+        return False
+
+    # Cheapest check first, so a flooding client costs a dict lookup
+    if manager.limiter.enabled and not manager.limiter.allow(user["id"], time.monotonic()):
+        metrics.inbound_rejections.labels("client_update_position", "rate_limited").inc()
+        return False
+
+    position = parse_position(data)
+    if position is None:
+        metrics.inbound_rejections.labels("client_update_position", "invalid").inc()
+        return False
+
+    # Identity comes from the session, never from the payload
+    data = {key: value for key, value in user.items() if key != "timestamp"}
+    data.update(position)
+
     await manager.update_position(sid, data)
+    return True
+
+@sio.on("client_nearby")
+async def client_nearby(sid, data):
+    groups = manager.get_groups(sid)
+
+    try:
+        query = NearbyQuerySchema.model_validate(data)
+    except ValidationError:
+        return []
+
+    group_id = str(data.get("group_id", groups[0] if groups else ""))
+    if group_id not in groups:
+        return []
+
+    return await manager.nearby(
+        group_id,
+        lat=query.lat,
+        long=query.long,
+        radius=query.radius,
+        k=query.k,
+        bbox=query.bbox,
+    )
+
+@sio.on("client_set_interest")
+async def client_set_interest(sid, data):
+    try:
+        query = InterestSchema.model_validate(data)
+    except ValidationError:
+        return False
+
+    if query.bbox is not None:
+        manager.set_interest(sid, Area(bbox=query.bbox))
+    else:
+        manager.set_interest(sid, Area(center=(query.lat, query.long), radius=query.radius))
+
+    return True
+
+@sio.on("client_clear_interest")
+async def client_clear_interest(sid, data=None):
+    manager.clear_interest(sid)
+    return True
+
+@sio.on("client_waypoints_resync")
+async def client_waypoints_resync(sid, data=None):
+    groups = manager.get_groups(sid)
+    if not groups:
+        return None
+
+    return await run_in_db_executor(load_waypoints, int(groups[0]))
 
 @sio.on("client_stop_sharing")
-async def client_update(sid, data):
-    await manager.remove_user(sid, 0)
+async def client_stop_sharing(sid, data):
+    await manager.remove_users([sid])
 
 @sio.on("disconnect")
 async def disconnect(sid):
-    manager.cancelable_remove_user(sid, delay=10)
\ No newline at end of file
+    metrics.socket_disconnects.inc()
+    manager.clear_interest(sid)
+    manager.drop_outbound(sid)
+    manager.schedule_removal(sid, settings.DISCONNECT_GRACE_PERIOD)
\ No newline at end of file
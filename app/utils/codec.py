@@ -0,0 +1,60 @@
+"""
+Compact binary encoding of position updates.
+
+A payload is a sequence of fixed-width little-endian records:
+
+    uint32   user id
+    int32    lat in 1e-7 degrees  (-2**31 when unknown)
+    int32    long in 1e-7 degrees (-2**31 when unknown)
+    float64  timestamp (seconds since the epoch)
+    uint32   sequence number within the group
+
+Usernames and other member data are not repeated, clients resolve user ids
+against the `server_data` roster snapshot.
+"""
+
+import struct
+import time
+
+POSITION_RECORD = struct.Struct("<IiidI")
+
+COORDINATE_SCALE = 10_000_000
+UNKNOWN_COORDINATE = -(2**31)
+
+
+def _coordinate(value) -> int:
+    if not isinstance(value, (int, float)) or not -180 <= value <= 180:
+        return UNKNOWN_COORDINATE
+
+    return round(value * COORDINATE_SCALE)
+
+
+def pack_position(data: dict, seq: int) -> bytes:
+    timestamp = data.get("timestamp")
+    if not isinstance(timestamp, (int, float)):
+        timestamp = time.time()
+
+    return POSITION_RECORD.pack(
+        data.get("id") or 0,
+        _coordinate(data.get("lat")),
+        _coordinate(data.get("long")),
+        timestamp,
+        seq & 0xFFFFFFFF,
+    )
+
+
+def encode_positions(records: list[bytes]) -> bytes:
+    return b"".join(records)
+
+
+def decode_positions(payload: bytes) -> list[dict]:
+    return [
+        {
+            "id": user_id,
+            "lat": None if lat == UNKNOWN_COORDINATE else lat / COORDINATE_SCALE,
+            "long": None if long == UNKNOWN_COORDINATE else long / COORDINATE_SCALE,
+            "timestamp": timestamp,
+            "seq": seq,
+        }
+        for user_id, lat, long, timestamp, seq in POSITION_RECORD.iter_unpack(payload)
+    ]
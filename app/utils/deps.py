@@ -1,5 +1,4 @@
 import re
-from collections.abc import Generator
 from enum import Enum
 from typing import Annotated
 import jwt
@@ -8,22 +7,21 @@ from fastapi.security import HTTPBearer
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
 from sqlalchemy import select
-from sqlalchemy.orm import Session
 from app.core import security
+from app.core.auth_cache import token_cache
 from app.core.config import settings
-from app.core.database import engine
+from app.core.database import SessionDep
 from app.models import UserModel
 
-def get_db() -> Generator[Session, None, None]:
-    with Session(engine) as session:
-        yield session
-
-
-SessionDep = Annotated[Session, Depends(get_db)]
 TokenDep = Annotated[str, Depends(HTTPBearer())]
 
 
 def get_current_user(db_session: SessionDep, token: TokenDep) -> UserModel:
+    user = token_cache.resolve(db_session, token.credentials)
+
+    if user is not None:
+        return user
+
     try:
         token_data = jwt.decode(
             token.credentials, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
@@ -40,6 +38,14 @@ def get_current_user(db_session: SessionDep, token: TokenDep) -> UserModel:
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user.")
 
+    if user.credentials_version != token_data.get("ver", 0):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials.",
+        )
+
+    token_cache.set(token.credentials, user, expires_at=token_data["exp"])
+
     return user
 
 
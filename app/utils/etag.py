@@ -0,0 +1,25 @@
+from fastapi import Request, Response, status
+
+
+def make_etag(*parts) -> str:
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+
+def check_etag(request: Request, response: Response, etag: str) -> Response | None:
+    """
+    Sets the ETag of the response and returns a `304 Not Modified` response
+    when the client already holds that version.
+    """
+
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    if "*" in tags or etag in tags or etag.removeprefix("W/") in tags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return None
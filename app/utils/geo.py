@@ -0,0 +1,213 @@
+import math
+
+EARTH_RADIUS = 6_371_008.8
+# Metres per degree of latitude
+METRES_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+
+def haversine(lat1: float, long1: float, lat2: float, long2: float) -> float:
+    """
+    Great-circle distance in metres between two points.
+    """
+
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(long2 - long1)
+
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def is_valid_position(lat, long) -> bool:
+    return (
+        isinstance(lat, (int, float))
+        and isinstance(long, (int, float))
+        and -90 <= lat <= 90
+        and -180 <= long <= 180
+    )
+
+
+class Area:
+    """
+    A bounding box (south, west, north, east) or a circle around a center.
+    """
+
+    def __init__(
+        self,
+        bbox: tuple[float, float, float, float] | None = None,
+        center: tuple[float, float] | None = None,
+        radius: float | None = None,
+    ):
+        self.bbox = bbox
+        self.center = center
+        self.radius = radius
+
+    def contains(self, lat: float, long: float) -> bool:
+        if self.bbox is not None:
+            south, west, north, east = self.bbox
+            if not south <= lat <= north:
+                return False
+            if west <= east:
+                return west <= long <= east
+            return long >= west or long <= east
+
+        return haversine(*self.center, lat, long) <= self.radius
+
+
+class GridIndex:
+    """
+    Uniform lat/long grid of points keyed by id, updated incrementally.
+
+    Each cell is `cell_size` degrees wide, so radius, bounding box and
+    nearest queries only visit the cells around the query point. Columns
+    are counted from -180°, in a whole number that wraps around the
+    antimeridian, so they may be slightly narrower than `cell_size`.
+    """
+
+    def __init__(self, cell_size: float = 0.01):
+        self.cell_size = cell_size
+        self._columns = max(1, math.ceil(360 / cell_size - 1e-9))
+        self._column_width = 360 / self._columns
+        self._cells: dict[tuple[int, int], set[int]] = {}
+        self._points: dict[int, tuple[float, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._points
+
+    def _cell(self, lat: float, long: float) -> tuple[int, int]:
+        # 180° itself falls in the last column
+        column = min(self._columns - 1, math.floor((long + 180) / self._column_width))
+        return math.floor(lat / self.cell_size), column
+
+    def get(self, key: int) -> tuple[float, float] | None:
+        return self._points.get(key)
+
+    def update(self, key: int, lat: float, long: float):
+        old = self._points.get(key)
+        cell = self._cell(lat, long)
+
+        if old is not None:
+            old_cell = self._cell(*old)
+            if old_cell != cell:
+                self._discard(old_cell, key)
+                self._cells.setdefault(cell, set()).add(key)
+        else:
+            self._cells.setdefault(cell, set()).add(key)
+
+        self._points[key] = (lat, long)
+
+    def remove(self, key: int):
+        old = self._points.pop(key, None)
+        if old is not None:
+            self._discard(self._cell(*old), key)
+
+    def _discard(self, cell: tuple[int, int], key: int):
+        keys = self._cells.get(cell)
+        if keys is None:
+            return
+
+        keys.discard(key)
+        if not keys:
+            del self._cells[cell]
+
+    def bbox(self, south: float, west: float, north: float, east: float) -> list[int]:
+        """
+        Ids inside the box. `west` > `east` wraps around the antimeridian.
+        """
+
+        def contains(lat: float, long: float) -> bool:
+            if not south <= lat <= north:
+                return False
+            if west <= east:
+                return west <= long <= east
+            return long >= west or long <= east
+
+        min_i, min_j = self._cell(south, west)
+        max_i, max_j = self._cell(north, east)
+        n_cells = (max_i - min_i + 1) * ((max_j - min_j + 1) if west <= east else 1)
+
+        # A box covering more cells than there are points is cheaper to scan
+        if west > east or n_cells > len(self._cells):
+            return [key for key, point in self._points.items() if contains(*point)]
+
+        result = []
+        for i in range(min_i, max_i + 1):
+            for j in range(min_j, max_j + 1):
+                for key in self._cells.get((i, j), ()):
+                    if contains(*self._points[key]):
+                        result.append(key)
+
+        return result
+
+    def radius(self, lat: float, long: float, radius: float) -> list[tuple[int, float]]:
+        """
+        (id, distance) pairs within `radius` metres, nearest first.
+        """
+
+        d_lat = radius / METRES_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(89.9, abs(lat) + d_lat)))
+        d_long = min(180.0, d_lat / max(cos_lat, 1e-6))
+
+        south, north = max(-90.0, lat - d_lat), min(90.0, lat + d_lat)
+        if d_long >= 180:
+            west, east = -180.0, 180.0
+        else:
+            west = (long - d_long + 180) % 360 - 180
+            east = (long + d_long + 180) % 360 - 180
+
+        result = []
+        for key in self.bbox(south, west, north, east):
+            distance = haversine(lat, long, *self._points[key])
+            if distance <= radius:
+                result.append((key, distance))
+
+        result.sort(key=lambda item: item[1])
+        return result
+
+    def nearest(self, lat: float, long: float, k: int) -> list[tuple[int, float]]:
+        """
+        The `k` nearest (id, distance) pairs, nearest first.
+        """
+
+        if k <= 0 or not self._points:
+            return []
+
+        if k >= len(self._points):
+            return sorted(
+                ((key, haversine(lat, long, *point)) for key, point in self._points.items()),
+                key=lambda item: item[1],
+            )
+
+        center_i, center_j = self._cell(lat, long)
+        found: list[tuple[int, float]] = []
+        visited = 0
+        ring = 0
+
+        # Visit rings of cells around the query point until the k-th distance
+        # is closer than anything the unvisited rings could contain. Columns
+        # wrap at ±180°, and haversine measures across the antimeridian too
+        while visited <= len(self._cells):
+            for i in range(center_i - ring, center_i + ring + 1):
+                step = 1 if abs(i - center_i) == ring else 2 * ring
+                for j in range(center_j - ring, center_j + ring + 1, step):
+                    visited += 1
+                    for key in self._cells.get((i, j % self._columns), ()):
+                        found.append((key, haversine(lat, long, *self._points[key])))
+
+            if len(found) >= k:
+                found.sort(key=lambda item: item[1])
+                cos_lat = math.cos(math.radians(min(89.9, abs(lat) + (ring + 1) * self.cell_size)))
+                bound = 0.9 * ring * min(self.cell_size, self._column_width) * METRES_PER_DEGREE * cos_lat
+                if found[k - 1][1] <= bound:
+                    return found[:k]
+
+            ring += 1
+
+        # Sparse index: scanning every point is cheaper than more rings
+        return sorted(
+            ((key, haversine(lat, long, *point)) for key, point in self._points.items()),
+            key=lambda item: item[1],
+        )[:k]
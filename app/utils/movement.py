@@ -0,0 +1,54 @@
+from app.utils.geo import haversine
+
+
+class MovementFilter:
+    """
+    Decides whether a position update is worth broadcasting.
+
+    An update is suppressed when it arrives less than `min_interval` seconds
+    after the last broadcast of the user, or when it moved less than
+    `min_distance` metres from the last broadcast position. A broadcast is
+    always let through once `keepalive` seconds passed since the last one.
+
+    A suppressed update is held: `held_until` tells when it should be
+    checked again, so the caller can send it even if the client goes quiet.
+    """
+
+    def __init__(self, min_distance: float, min_interval: float, keepalive: float):
+        self.min_distance = min_distance
+        self.min_interval = min_interval
+        self.keepalive = keepalive
+
+        # user id -> (time, lat, long) of the last broadcast
+        self._last: dict[int, tuple[float, float, float]] = {}
+        # user id -> when the held update is due for another check
+        self._held: dict[int, float] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.min_distance > 0 or self.min_interval > 0
+
+    def should_broadcast(self, user_id: int, lat: float, long: float, now: float) -> bool:
+        last = self._last.get(user_id)
+
+        if last is not None:
+            elapsed = now - last[0]
+
+            if elapsed < self.keepalive:
+                if elapsed < self.min_interval:
+                    self._held[user_id] = last[0] + self.min_interval
+                    return False
+                if haversine(last[1], last[2], lat, long) < self.min_distance:
+                    self._held[user_id] = last[0] + self.keepalive
+                    return False
+
+        self._last[user_id] = (now, lat, long)
+        self._held.pop(user_id, None)
+        return True
+
+    def held_until(self, user_id: int) -> float | None:
+        return self._held.get(user_id)
+
+    def forget(self, user_id: int):
+        self._last.pop(user_id, None)
+        self._held.pop(user_id, None)
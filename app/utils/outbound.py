@@ -0,0 +1,83 @@
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class LatestWinsQueue:
+    """
+    Position updates waiting for one slow socket.
+
+    Entries are keyed by group and user, so a newer update of a member
+    replaces the queued one. Once `maxsize` members are queued, the oldest
+    entry is dropped to make room.
+    """
+
+    def __init__(self, maxsize: int, since: float):
+        self.maxsize = maxsize
+        # When the socket started falling behind
+        self.since = since
+
+        # (group id, user id) -> (sequence, position)
+        self._items: OrderedDict[tuple[str, int], tuple[int, dict]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, group_id: str, position: dict, seq: int) -> str | None:
+        """
+        Queue a position, returns why an older entry was dropped if one was.
+        """
+
+        key = (group_id, position.get("id"))
+        dropped = None
+
+        if key in self._items:
+            del self._items[key]
+            dropped = "replaced"
+        elif len(self._items) >= self.maxsize:
+            self._items.popitem(last=False)
+            dropped = "overflow"
+
+        self._items[key] = (seq, position)
+        return dropped
+
+    def drain(self) -> dict[str, list[tuple[int, dict]]]:
+        batches: dict[str, list[tuple[int, dict]]] = {}
+        for (group_id, _), item in self._items.items():
+            batches.setdefault(group_id, []).append(item)
+
+        self._items.clear()
+        return batches
+
+
+class TransportBacklog:
+    """
+    Counts the packets engine.io queued for a Socket.IO socket and has not
+    written out yet.
+
+    python-engineio has no public API for this, so it reads the server's
+    `sockets` map and the socket's `queue`. If those change, the backlog
+    reads as unknown, with one warning, and slow consumer detection stops
+    instead of breaking the check every time.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.supported = True
+
+    def __call__(self, sid: str, namespace: str = "/") -> int | None:
+        if not self.supported:
+            return None
+
+        eio_sid = self.server.manager.eio_sid_from_sid(sid, namespace)
+        if eio_sid is None:
+            return None
+
+        try:
+            socket = self.server.eio.sockets.get(eio_sid)
+            return socket.queue.qsize() if socket is not None else None
+        except AttributeError:
+            self.supported = False
+            logger.warning("engine.io does not expose socket queues, slow consumers are not detected")
+            return None
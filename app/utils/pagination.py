@@ -0,0 +1,72 @@
+import base64
+import binascii
+
+from fastapi import HTTPException
+from sqlalchemy import Select, func, select
+from sqlalchemy.orm import Session
+
+from app.schemas.misc import PaginatedList
+
+
+def encode_cursor(last_id: int, page: int, total_size: int) -> str:
+    return base64.urlsafe_b64encode(f"{last_id}:{page}:{total_size}".encode()).decode()
+
+
+def decode_cursor(cursor: str | None) -> tuple[int, int, int | None]:
+    """
+    Last key, page number and total size carried by a cursor. The total is
+    None for the first page and for cursors issued without one.
+    """
+
+    if not cursor:
+        return 0, 1, None
+
+    try:
+        values = list(map(int, base64.urlsafe_b64decode(cursor.encode()).decode().split(":")))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+    if len(values) not in (2, 3) or values[1] < 1 or min(values) < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+    last_id, page, total_size = (values + [None])[:3]
+    return last_id, page, total_size
+
+
+def paginate(db_session: Session, stmt: Select, key, limit: int, cursor: str | None) -> PaginatedList:
+    """
+    Keyset pagination of `stmt` ordered by the unique column `key`.
+
+    Pages continue after the last key of the previous one instead of using
+    OFFSET, so every page is a single index range scan. The total is
+    counted once, on the first page, and carried by the cursor: it is a
+    snapshot taken when the listing started.
+    """
+
+    last_id, page, total_size = decode_cursor(cursor)
+
+    rows = db_session.scalars(stmt.where(key > last_id).order_by(key).limit(limit + 1)).all()
+
+    if total_size is None:
+        if not cursor and len(rows) <= limit:
+            # A single page holds everything
+            total_size = len(rows)
+        else:
+            total_size = db_session.scalar(select(func.count()).select_from(stmt.order_by(None).subquery()))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(getattr(rows[-1], key.key), page + 1, total_size)
+
+    # Rows deleted since the cursor was issued can shrink the page count
+    total_pages = max(-(-total_size // limit), 1)
+
+    return PaginatedList(
+        page_limit=limit,
+        page_size=len(rows),
+        total_size=total_size,
+        current_page=min(page, total_pages),
+        data=rows,
+        next_cursor=next_cursor,
+    )
@@ -0,0 +1,49 @@
+from typing import Hashable
+
+
+class TokenBucketLimiter:
+    """
+    One token bucket per key, refilled at `rate` tokens per second up to
+    `burst`. Each allowed call takes a token.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+
+        # key -> [tokens, last refill]
+        self._buckets: dict[Hashable, list[float]] = {}
+
+        self.allowed = 0
+        self.limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def allow(self, key: Hashable, now: float) -> bool:
+        bucket = self._buckets.get(key)
+
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            self.allowed += 1
+            return True
+
+        self.limited += 1
+        return False
+
+    def forget(self, key: Hashable):
+        self._buckets.pop(key, None)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "keys": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
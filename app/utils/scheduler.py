@@ -0,0 +1,134 @@
+import asyncio
+import inspect
+import logging
+import math
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+    __slots__ = ("handler", "item", "slot", "rounds", "_wheel")
+
+    def __init__(self, wheel: "TimerWheel", handler: Callable, item: Any, slot: int, rounds: int):
+        self._wheel = wheel
+        self.handler = handler
+        self.item = item
+        self.slot = slot
+        self.rounds = rounds
+
+    def cancel(self):
+        self._wheel._slots[self.slot].pop(id(self), None)
+
+
+class PeriodicJob:
+    __slots__ = ("interval", "job", "timer", "cancelled")
+
+    def __init__(self, interval: float, job: Callable[[], Any]):
+        self.interval = interval
+        self.job = job
+        self.timer: Timer | None = None
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        if self.timer:
+            self.timer.cancel()
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel driven by a single task, with O(1) schedule and
+    cancel.
+
+    Timers due in the same tick are delivered in batches: each handler is
+    called once per tick with the list of its due items, so callers can
+    coalesce the resulting work (e.g. one emit per group).
+    """
+
+    def __init__(self, tick: float = 0.1, slots: int = 512):
+        self.tick = tick
+        self._slots: list[dict[int, Timer]] = [{} for _ in range(slots)]
+        self._cursor = 0
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return sum(len(slot) for slot in self._slots)
+
+    def schedule(self, delay: float, handler: Callable[[list], Any], item: Any = None) -> Timer:
+        """
+        Calls `handler([item, ...])` after `delay` seconds, rounded up to
+        whole ticks. The handler may be a coroutine function.
+        """
+
+        ticks = max(1, math.ceil(delay / self.tick))
+        slot = (self._cursor + ticks) % len(self._slots)
+        timer = Timer(self, handler, item, slot, (ticks - 1) // len(self._slots))
+
+        self._slots[slot][id(timer)] = timer
+        return timer
+
+    def every(self, interval: float, job: Callable[[], Any]) -> PeriodicJob:
+        """
+        Runs `job()` every `interval` seconds until the returned job is
+        cancelled.
+        """
+
+        periodic = PeriodicJob(interval, job)
+        periodic.timer = self.schedule(interval, self._run_periodic, periodic)
+        return periodic
+
+    async def _run_periodic(self, jobs: list[PeriodicJob]):
+        for periodic in jobs:
+            if periodic.cancelled:
+                continue
+
+            # Rescheduled first, so a failing job keeps running
+            periodic.timer = self.schedule(periodic.interval, self._run_periodic, periodic)
+            await self._call(periodic.job)
+
+    def _advance(self) -> dict[Callable, list]:
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        slot = self._slots[self._cursor]
+
+        batches: dict[Callable, list] = {}
+        for key, timer in list(slot.items()):
+            if timer.rounds:
+                timer.rounds -= 1
+                continue
+
+            del slot[key]
+            batches.setdefault(timer.handler, []).append(timer.item)
+
+        return batches
+
+    @staticmethod
+    async def _call(handler: Callable, *args):
+        try:
+            result = handler(*args)
+            if inspect.isawaitable(result):
+                await result
+        except Exception:
+            logger.exception(f"Error in scheduled {getattr(handler, '__qualname__', handler)}")
+
+    def start(self):
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+
+        while True:
+            # Ticks missed while the loop was busy run back to back
+            deadline += self.tick
+            await asyncio.sleep(max(0, deadline - loop.time()))
+
+            for handler, items in self._advance().items():
+                await self._call(handler, items)
@@ -0,0 +1,251 @@
+"""
+Seeded lookup benchmark.
+
+Fills the configured database with synthetic users, groups, memberships and
+waypoints, then measures the latency of the endpoints that depend on the
+lookup indexes. `--drop-indexes` measures without the four lookup indexes
+(ix_user_username, ix_group_code, ix_user_group_group_id_user_id,
+ix_waypoint_group_id_id) and recreates them afterwards, so both runs use
+the same, current schema:
+
+    python scripts/benchmark_lookups.py --seed
+    python scripts/benchmark_lookups.py --drop-indexes --output before.json
+    python scripts/benchmark_lookups.py --output after.json
+    python scripts/benchmark_lookups.py --compare before.json after.json
+
+No reference numbers are recorded yet, run it on a PostgreSQL database.
+
+Seeded rows are prefixed with `bench_` (users) and `z` (group codes, never
+produced by the app), so they can live next to real data of a dev database.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import engine
+from app.core.security import get_password_hash
+from app.main import app
+from app.models import Base
+
+PASSWORD = "bench-password"
+BENCH_USER = "bench_client"
+LOOKUP_INDEXES = ("ix_user_username", "ix_group_code", "ix_user_group_group_id_user_id", "ix_waypoint_group_id_id")
+
+
+def lookup_indexes() -> list:
+    indexes = {index.name: index for table in Base.metadata.tables.values() for index in table.indexes}
+    return [indexes[name] for name in LOOKUP_INDEXES]
+
+
+def drop_indexes():
+    with engine.begin() as connection:
+        for index in lookup_indexes():
+            index.drop(connection, checkfirst=True)
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("ANALYZE"))
+
+
+def create_indexes():
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        for index in lookup_indexes():
+            index.create(connection, checkfirst=True)
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("ANALYZE"))
+
+    print(f"recreated the lookup indexes in {time.perf_counter() - start:.1f}s")
+
+
+def seed(users: int, groups: int, waypoints: int):
+    password = get_password_hash(PASSWORD)
+
+    with engine.begin() as connection:
+        start = time.perf_counter()
+
+        connection.execute(
+            text(
+                """
+                INSERT INTO "user" (username, password)
+                SELECT 'bench_user_' || g, :password FROM generate_series(1, :users) g
+                """
+            ),
+            {"password": password, "users": users},
+        )
+        first_user = connection.scalar(text("""SELECT min(id) FROM "user" WHERE username LIKE 'bench_user_%'"""))
+
+        connection.execute(
+            text(
+                """
+                INSERT INTO "group" (user_owner_id, name, code)
+                SELECT :first_user + (g % :users), 'bench group ' || g, 'z' || lpad(to_hex(g), 5, '0')
+                FROM generate_series(1, :groups) g
+                """
+            ),
+            {"first_user": first_user, "users": users, "groups": groups},
+        )
+        first_group = connection.scalar(text("""SELECT min(id) FROM "group" WHERE code LIKE 'z%'"""))
+
+        # Every user is a member of one group
+        connection.execute(
+            text(
+                """
+                INSERT INTO user_group (user_id, group_id)
+                SELECT :first_user + g, :first_group + (g % :groups)
+                FROM generate_series(0, :users - 1) g
+                """
+            ),
+            {"first_user": first_user, "first_group": first_group, "users": users, "groups": groups},
+        )
+        connection.execute(
+            text(
+                """
+                INSERT INTO waypoint (group_id, name, lat, long)
+                SELECT :first_group + (g % :groups), 'bench waypoint ' || g,
+                       random() * 180 - 90, random() * 360 - 180
+                FROM generate_series(0, :waypoints - 1) g
+                """
+            ),
+            {"first_group": first_group, "groups": groups, "waypoints": waypoints},
+        )
+
+        print(f"seeded in {time.perf_counter() - start:.1f}s")
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("ANALYZE"))
+
+
+def percentiles(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    pick = lambda q: samples[min(int(q * len(samples)), len(samples) - 1)]
+
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.fmean(samples),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+    }
+
+
+def measure(client: TestClient, requests: int) -> dict:
+    api = settings.API_V1_STR
+
+    with engine.connect() as connection:
+        users = connection.scalars(
+            text("""SELECT username FROM "user" WHERE username LIKE 'bench_user_%' ORDER BY random() LIMIT :n"""),
+            {"n": requests},
+        ).all()
+        codes = connection.scalars(
+            text("""SELECT code FROM "group" WHERE code LIKE 'z%' ORDER BY random() LIMIT :n"""),
+            {"n": requests},
+        ).all()
+
+    if not users or not codes:
+        raise SystemExit("No seeded data found, run with --seed first.")
+
+    client.post(f"{api}/users/", json={"username": BENCH_USER, "password": PASSWORD})
+    token = client.post(
+        f"{api}/auth/login/access-token/", json={"username": BENCH_USER, "password": PASSWORD}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def timed(method: str, url: str, **kwargs) -> tuple[float, dict]:
+        start = time.perf_counter()
+        response = client.request(method, url, **kwargs)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        if response.status_code >= 500:
+            raise SystemExit(f"{method} {url} failed with {response.status_code}")
+        return elapsed, response.json()
+
+    results: dict[str, list[float]] = {name: [] for name in ("signup_conflict", "login", "join_group", "members", "waypoints")}
+    group_ids = []
+
+    for username in users:
+        # Username lookup only, the request is rejected before hashing
+        results["signup_conflict"].append(timed("POST", f"{api}/users/", json={"username": username, "password": "x"})[0])
+
+    # Dominated by password verification, kept to spot regressions around it
+    for username in users[: max(len(users) // 10, 1)]:
+        results["login"].append(
+            timed("POST", f"{api}/auth/login/access-token/", json={"username": username, "password": PASSWORD})[0]
+        )
+
+    for code in codes:
+        elapsed, group = timed("POST", f"{api}/groups/join/{code}", headers=headers)
+        results["join_group"].append(elapsed)
+        group_ids.append(group["id"])
+
+    for group_id in group_ids:
+        results["members"].append(timed("GET", f"{api}/groups/{group_id}/members/", headers=headers)[0])
+        results["waypoints"].append(timed("GET", f"{api}/groups/{group_id}/waypoints/", headers=headers)[0])
+
+    return {name: percentiles(samples) for name, samples in results.items()}
+
+
+def compare(before_path: str, after_path: str):
+    before = json.loads(Path(before_path).read_text())
+    after = json.loads(Path(after_path).read_text())
+
+    print(f"{'endpoint':<18}{'before p50':>12}{'after p50':>12}{'before p99':>12}{'after p99':>12}{'speedup':>10}")
+    for name in before:
+        if name not in after:
+            continue
+        b, a = before[name], after[name]
+        speedup = b["p50_ms"] / a["p50_ms"] if a["p50_ms"] else float("inf")
+        print(f"{name:<18}{b['p50_ms']:>12.2f}{a['p50_ms']:>12.2f}{b['p99_ms']:>12.2f}{a['p99_ms']:>12.2f}{speedup:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", action="store_true", help="insert the synthetic data set and exit")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--groups", type=int, default=100_000)
+    parser.add_argument("--waypoints", type=int, default=1_000_000)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument(
+        "--drop-indexes", action="store_true", help="measure without the lookup indexes, recreated afterwards"
+    )
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.seed:
+        seed(args.users, args.groups, args.waypoints)
+        return
+
+    if args.drop_indexes:
+        drop_indexes()
+
+    try:
+        with TestClient(app) as client:
+            results = measure(client, args.requests)
+    finally:
+        if args.drop_indexes:
+            create_indexes()
+
+    for name, stats in results.items():
+        print(f"{name:<18}p50 {stats['p50_ms']:8.2f} ms   p95 {stats['p95_ms']:8.2f} ms   p99 {stats['p99_ms']:8.2f} ms")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Password hashing throughput, to pick PASSWORD_HASH_ROUNDS and
+PASSWORD_HASH_WORKERS against a CPU budget.
+
+For each bcrypt cost and pool size, keeps the password hasher saturated with
+login verifications for `--duration` seconds and reports logins per second,
+per worker thread, and the latency of a single verification:
+
+    python scripts/benchmark_passwords.py --rounds 10 11 12 --workers 1 2 4
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+for key, value in {
+    "PROJECT_NAME": "password-benchmark",
+    "POSTGRES_SERVER": "localhost",
+    "POSTGRES_USER": "benchmark",
+    "POSTGRES_PASSWORD": "benchmark",
+    "POSTGRES_DB": "benchmark",
+}.items():
+    os.environ.setdefault(key, value)
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from passlib.context import CryptContext
+
+from app.core import security
+from app.core.security import PasswordHasher
+
+PASSWORD = "bench-password"
+
+
+async def measure(rounds: int, workers: int, duration: float) -> dict:
+    context = CryptContext(
+        schemes=["bcrypt"], bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds
+    )
+    hashed = context.hash(PASSWORD)
+
+    # The hasher runs whatever context the module exposes
+    security.pwd_context = context
+    hasher = PasswordHasher(workers=workers, max_pending=workers)
+
+    latencies: list[float] = []
+    until = time.perf_counter() + duration
+
+    async def login_loop():
+        while time.perf_counter() < until:
+            start = time.perf_counter()
+            assert await hasher.verify(PASSWORD, hashed)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(login_loop() for _ in range(workers * 2)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "rounds": rounds,
+        "workers": workers,
+        "logins_per_second": len(latencies) / elapsed,
+        "logins_per_second_per_worker": len(latencies) / elapsed / workers,
+        "latency_ms": statistics.median(latencies) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--duration", type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'rounds':>6}{'workers':>9}{'logins/s':>11}{'per worker':>12}{'p50 ms':>9}")
+
+    for rounds in args.rounds:
+        for workers in sorted(set(args.workers)):
+            result = asyncio.run(measure(rounds, workers, args.duration))
+            print(
+                f"{result['rounds']:>6}{result['workers']:>9}{result['logins_per_second']:>11.1f}"
+                f"{result['logins_per_second_per_worker']:>12.1f}{result['latency_ms']:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+Realtime load test of the Socket.IO layer.
+
+Starts the app in-process with uvicorn on a SQLite stand-in database, then
+simulates `--groups` groups of `--clients` members each. Every client logs
+in through `/auth/login/access-token/`, connects to `/ws/socket.io` and
+streams `client_update_position` at `--rate` updates per second (keep it
+within `POSITION_RATE_LIMIT`, or raise the limit).
+
+Reported:
+  - end-to-end fan-out latency percentiles (client send -> peer receive)
+  - position messages sent and received per second
+  - process CPU usage and RSS (server and clients share the process, so
+    CPU is an upper bound of the server's share)
+
+    python scripts/benchmark_realtime.py --groups 10 --clients 20 --duration 30
+    POSITION_TICK_RATE=10 python scripts/benchmark_realtime.py --output tick.json
+
+Clients speak the Engine.IO v4 / Socket.IO text protocol directly over
+`websockets`, so no extra client dependency is needed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Settings are read at import time, the database settings are unused here
+for key, value in {
+    "PROJECT_NAME": "realtime-benchmark",
+    "POSTGRES_SERVER": "localhost",
+    "POSTGRES_USER": "benchmark",
+    "POSTGRES_PASSWORD": "benchmark",
+    "POSTGRES_DB": "benchmark",
+    # SQLite cannot autoincrement the BIGINT history ids
+    "POSITION_HISTORY_ENABLED": "false",
+    "LOOP_LAG_REPORT_INTERVAL": "3600",
+}.items():
+    os.environ.setdefault(key, value)
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import httpx
+import uvicorn
+import websockets
+from sqlalchemy import create_engine, select
+
+import app.core.database as database
+from app.core.config import settings
+from app.core.security import get_password_hash
+from app.models import Base, GroupModel, UserModel, _UserGroupModel
+
+PASSWORD = "bench-password"
+
+
+def use_sqlite(path: str):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    database.engine = engine
+    database.SessionLocal.configure(bind=engine)
+    Base.metadata.create_all(engine)
+
+
+def seed(groups: int, clients: int) -> list[tuple[int, list[str]]]:
+    """
+    Inserts the users, groups and memberships directly, returns the
+    usernames of each group.
+    """
+
+    password = get_password_hash(PASSWORD)
+
+    with database.SessionLocal() as db_session:
+        UserModel.bulk_create(
+            db_session,
+            [{"username": f"bench_{g}_{c}", "password": password} for g in range(groups) for c in range(clients)],
+        )
+        user_ids = dict(db_session.execute(select(UserModel.username, UserModel.id)).all())
+
+        GroupModel.bulk_create(
+            db_session,
+            [
+                {"user_owner_id": user_ids[f"bench_{g}_0"], "name": f"bench group {g}", "code": f"b{g:05x}"}
+                for g in range(groups)
+            ],
+        )
+        group_ids = dict(db_session.execute(select(GroupModel.code, GroupModel.id)).all())
+
+        _UserGroupModel.bulk_create(
+            db_session,
+            [
+                {"user_id": user_ids[f"bench_{g}_{c}"], "group_id": group_ids[f"b{g:05x}"]}
+                for g in range(groups)
+                for c in range(clients)
+            ],
+        )
+
+    return [(group_ids[f"b{g:05x}"], [f"bench_{g}_{c}" for c in range(clients)]) for g in range(groups)]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.sent = 0
+        self.received = 0
+        self.connected = 0
+        self.rejected = 0
+        self.recording = False
+
+    def record_positions(self, positions: list[dict]):
+        if not self.recording:
+            return
+
+        now = time.time()
+        for position in positions:
+            timestamp = position.get("timestamp")
+            if timestamp is not None:
+                self.latencies.append(now - timestamp)
+        self.received += len(positions)
+
+
+class BenchClient:
+    def __init__(self, url: str, user: dict, group_id: int, stats: Stats):
+        self.url = url
+        self.user = user
+        self.group_id = group_id
+        self.stats = stats
+        self.lat = random.uniform(-60, 60)
+        self.long = random.uniform(-170, 170)
+        self._ws = None
+        self._reader: asyncio.Task | None = None
+        self._connected = asyncio.Event()
+
+    async def connect(self, token: str) -> bool:
+        self._ws = await websockets.connect(
+            f"{self.url}/ws/socket.io/?EIO=4&transport=websocket&token={token}&group_id={self.group_id}",
+            max_size=None,
+        )
+        opening = await self._ws.recv()
+        if not opening.startswith("0"):
+            return False
+
+        self._reader = asyncio.create_task(self._read())
+        await self._ws.send("40")
+
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout=10)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def _read(self):
+        try:
+            async for message in self._ws:
+                if message == "2":
+                    await self._ws.send("3")
+                elif message.startswith("40"):
+                    self._connected.set()
+                elif message.startswith("41"):
+                    # The server rejected the connection
+                    break
+                elif message.startswith("42"):
+                    event, *args = json.loads(message[2:])
+                    if event == "server_update_position":
+                        self.stats.record_positions([args[0]])
+                    elif event == "server_update_positions":
+                        self.stats.record_positions(args[0])
+        except websockets.ConnectionClosed:
+            pass
+
+    async def stream(self, rate: float, until: float):
+        interval = 1 / rate
+        # Spread the clients over the first interval
+        await asyncio.sleep(random.uniform(0, interval))
+        deadline = time.monotonic()
+
+        while time.monotonic() < until:
+            self.lat += random.uniform(-0.0005, 0.0005)
+            self.long += random.uniform(-0.0005, 0.0005)
+
+            payload = {"lat": self.lat, "long": self.long, "timestamp": time.time()}
+            await self._ws.send("42" + json.dumps(["client_update_position", payload]))
+            self.stats.sent += 1
+
+            deadline += interval
+            await asyncio.sleep(max(0, deadline - time.monotonic()))
+
+    async def close(self):
+        if self._ws is not None:
+            await self._ws.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+
+def cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def percentile(samples: list[float], q: float) -> float:
+    return samples[min(int(q * len(samples)), len(samples) - 1)] if samples else 0.0
+
+
+async def login(http: httpx.AsyncClient, username: str, semaphore: asyncio.Semaphore) -> str:
+    async with semaphore:
+        response = await http.post(
+            f"{settings.API_V1_STR}/auth/login/access-token/", json={"username": username, "password": PASSWORD}
+        )
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+
+async def run(args) -> dict:
+    from app.main import app
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning", lifespan="on")
+    server = uvicorn.Server(config)
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    stats = Stats()
+    clients: list[BenchClient] = []
+
+    try:
+        start = time.perf_counter()
+        groups = seed(args.groups, args.clients)
+
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as http:
+            semaphore = asyncio.Semaphore(args.concurrency)
+            usernames = [username for _, members in groups for username in members]
+            tokens = await asyncio.gather(*(login(http, username, semaphore) for username in usernames))
+        tokens = dict(zip(usernames, tokens))
+
+        with database.SessionLocal() as db_session:
+            users = {
+                username: {"id": user_id, "username": username}
+                for username, user_id in db_session.execute(select(UserModel.username, UserModel.id))
+            }
+
+        for group_id, members in groups:
+            for username in members:
+                clients.append(BenchClient(f"ws://127.0.0.1:{args.port}", users[username], group_id, stats))
+
+        async def connect(client: BenchClient):
+            async with semaphore:
+                if await client.connect(tokens[client.user["username"]]):
+                    stats.connected += 1
+                else:
+                    stats.rejected += 1
+
+        await asyncio.gather(*(connect(client) for client in clients))
+        setup_time = time.perf_counter() - start
+
+        # Warm up, then measure
+        until = time.monotonic() + args.warmup + args.duration
+        streams = [asyncio.create_task(client.stream(args.rate, until)) for client in clients]
+
+        await asyncio.sleep(args.warmup)
+        stats.recording = True
+        sent_before = stats.sent
+        cpu_before, wall_before = cpu_time(), time.perf_counter()
+
+        await asyncio.gather(*streams)
+        wall = time.perf_counter() - wall_before
+        cpu = cpu_time() - cpu_before
+        sent = stats.sent - sent_before
+
+        # Let in-flight broadcasts arrive
+        await asyncio.sleep(0.5)
+        stats.recording = False
+    finally:
+        await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+        server.should_exit = True
+        await server_task
+
+    latencies = sorted(stats.latencies)
+    return {
+        "groups": args.groups,
+        "clients_per_group": args.clients,
+        "rate": args.rate,
+        "tick_rate": settings.POSITION_TICK_RATE,
+        "setup_seconds": setup_time,
+        "connected": stats.connected,
+        "rejected": stats.rejected,
+        "sent_per_second": sent / wall,
+        "received_per_second": stats.received / wall,
+        "latency_ms": {
+            "mean": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": (latencies[-1] if latencies else 0.0) * 1000,
+        },
+        "cpu_percent": cpu / wall * 100,
+        "rss_mb": rss_mb(),
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--clients", type=int, default=10, help="clients per group")
+    parser.add_argument("--rate", type=float, default=1, help="position updates per second per client")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--concurrency", type=int, default=50, help="parallel logins and connects")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        use_sqlite(os.path.join(directory, "benchmark.db"))
+        results = asyncio.run(run(args))
+
+    latency = results["latency_ms"]
+    print(f"clients     {results['connected']} connected, {results['rejected']} rejected ({results['setup_seconds']:.1f}s setup)")
+    print(f"throughput  {results['sent_per_second']:.0f} sent/s, {results['received_per_second']:.0f} received/s")
+    print(f"latency     p50 {latency['p50']:.2f} ms, p95 {latency['p95']:.2f} ms, p99 {latency['p99']:.2f} ms, max {latency['max']:.2f} ms")
+    print(f"process     {results['cpu_percent']:.0f}% CPU, {results['rss_mb']:.0f} MB RSS ({results['max_rss_mb']:.0f} MB peak)")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
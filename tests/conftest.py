@@ -0,0 +1,61 @@
+import itertools
+import os
+
+import pytest
+
+# Settings required at import time, no database server is contacted by these
+# tests. The lowest bcrypt cost keeps sign ups and logins fast.
+for name, value in {
+    "PROJECT_NAME": "group-maps-tests",
+    "POSTGRES_SERVER": "localhost",
+    "POSTGRES_USER": "postgres",
+    "POSTGRES_PASSWORD": "postgres",
+    "POSTGRES_DB": "app",
+    "PASSWORD_HASH_ROUNDS": "4",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture(scope="session")
+def api(tmp_path_factory):
+    """
+    A TestClient of the app on a SQLite database. It is shared by the whole
+    session, so ids never repeat behind the in-memory caches.
+    """
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine
+
+    from app.core import database
+    from app.main import app
+    from app.models import Base
+
+    engine = create_engine(
+        f"sqlite:///{tmp_path_factory.mktemp('db') / 'app.db'}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(engine)
+    database.SessionLocal.configure(bind=engine)
+
+    try:
+        with TestClient(app, base_url="http://testserver/api/v1") as client:
+            yield client
+    finally:
+        database.SessionLocal.configure(bind=database.engine)
+
+
+_usernames = itertools.count(1)
+
+
+@pytest.fixture
+def login(api):
+    """
+    Signs up a new user, returns the Authorization header of its token.
+    """
+
+    def login() -> dict:
+        username = f"user{next(_usernames)}"
+        api.post("/users/", json={"username": username, "password": "password"})
+        token = api.post("/auth/login/access-token/", json={"username": username, "password": "password"})
+        return {"Authorization": f"Bearer {token.json()['access_token']}"}
+
+    return login
@@ -0,0 +1,40 @@
+import pytest
+
+from app.utils.codec import POSITION_RECORD, decode_positions, encode_positions, pack_position
+
+
+def test_round_trip():
+    positions = [
+        {"id": 1, "lat": 48.8566142, "long": 2.3522219, "timestamp": 1_700_000_000.25},
+        {"id": 2, "lat": -90, "long": -180, "timestamp": 1_700_000_001.0},
+        {"id": 3, "lat": 90, "long": 180, "timestamp": 1_700_000_002.5},
+    ]
+
+    payload = encode_positions([pack_position(position, seq) for seq, position in enumerate(positions, 1)])
+    assert len(payload) == len(positions) * POSITION_RECORD.size
+
+    decoded = decode_positions(payload)
+    for seq, (position, record) in enumerate(zip(positions, decoded), 1):
+        assert record["id"] == position["id"]
+        assert record["lat"] == pytest.approx(position["lat"], abs=1e-7)
+        assert record["long"] == pytest.approx(position["long"], abs=1e-7)
+        assert record["timestamp"] == position["timestamp"]
+        assert record["seq"] == seq
+
+
+def test_unknown_coordinates_decode_as_none():
+    payload = pack_position({"id": 1, "lat": None, "long": "x", "timestamp": 1.0}, 1)
+
+    [record] = decode_positions(payload)
+    assert record["lat"] is None
+    assert record["long"] is None
+
+
+def test_sequence_wraps_to_uint32():
+    [record] = decode_positions(pack_position({"id": 1, "lat": 0, "long": 0, "timestamp": 1.0}, 2**32 + 5))
+
+    assert record["seq"] == 5
+
+
+def test_empty_payload():
+    assert decode_positions(encode_positions([])) == []
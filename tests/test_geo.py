@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+from app.utils.geo import GridIndex, haversine
+
+
+def brute_nearest(points: dict, lat: float, long: float, k: int) -> list[int]:
+    distances = sorted((haversine(lat, long, *point), key) for key, point in points.items())
+    return [key for _, key in distances[:k]]
+
+
+@pytest.fixture
+def points() -> dict[int, tuple[float, float]]:
+    rng = random.Random(7)
+    return {key: (rng.uniform(48.7, 49.0), rng.uniform(2.2, 2.5)) for key in range(500)}
+
+
+@pytest.fixture
+def index(points) -> GridIndex:
+    index = GridIndex(cell_size=0.01)
+    for key, point in points.items():
+        index.update(key, *point)
+    return index
+
+
+def test_nearest_matches_a_full_scan(index, points):
+    rng = random.Random(11)
+    for _ in range(50):
+        lat, long = rng.uniform(48.6, 49.1), rng.uniform(2.1, 2.6)
+        for k in (1, 5, 20):
+            found = index.nearest(lat, long, k)
+            assert [key for key, _ in found] == brute_nearest(points, lat, long, k)
+            assert [distance for _, distance in found] == sorted(distance for _, distance in found)
+
+
+def test_nearest_edge_cases(index, points):
+    assert index.nearest(48.8, 2.3, 0) == []
+    assert len(index.nearest(48.8, 2.3, 1000)) == len(points)
+    assert GridIndex().nearest(0, 0, 3) == []
+
+
+def test_radius(index, points):
+    found = index.radius(48.85, 2.35, 2000)
+
+    expected = {key for key, point in points.items() if haversine(48.85, 2.35, *point) <= 2000}
+    assert {key for key, _ in found} == expected
+    assert [distance for _, distance in found] == sorted(distance for _, distance in found)
+
+
+def test_bbox(index, points):
+    found = index.bbox(48.8, 2.3, 48.9, 2.4)
+
+    expected = {key for key, (lat, long) in points.items() if 48.8 <= lat <= 48.9 and 2.3 <= long <= 2.4}
+    assert set(found) == expected
+
+
+def test_bbox_across_the_antimeridian():
+    index = GridIndex(cell_size=1)
+    index.update(1, 0, 179.5)
+    index.update(2, 0, -179.5)
+    index.update(3, 0, 0)
+
+    assert sorted(index.bbox(-1, 179, 1, -179)) == [1, 2]
+
+
+def test_update_moves_and_remove_drops_points():
+    index = GridIndex(cell_size=0.01)
+    index.update(1, 10, 10)
+    index.update(1, 20, 20)
+
+    assert index.get(1) == (20, 20)
+    assert index.bbox(9, 9, 11, 11) == []
+    assert index.bbox(19, 19, 21, 21) == [1]
+
+    index.remove(1)
+    assert 1 not in index
+    assert index._cells == {}
+
+
+@pytest.mark.parametrize("cell_size", [0.01, 0.7, 1])
+def test_nearest_across_the_antimeridian(cell_size):
+    rng = random.Random(3)
+    index = GridIndex(cell_size=cell_size)
+    points = {}
+    for key in range(300):
+        long = rng.uniform(175, 185)
+        points[key] = (rng.uniform(-2, 2), (long + 180) % 360 - 180)
+        index.update(key, *points[key])
+    points[300] = (0, 180)
+    index.update(300, 0, 180)
+
+    for lat, long in [(0, 179.99), (0, -179.99), (0.5, 180), (-0.5, -180)]:
+        for k in (1, 10):
+            found = index.nearest(lat, long, k)
+            assert [key for key, _ in found] == brute_nearest(points, lat, long, k)
@@ -0,0 +1,116 @@
+import pytest
+
+from app.socket_manager import authenticate
+
+
+def create_group(api, headers: dict, name: str = "group") -> dict:
+    response = api.post("/groups/", json={"name": name}, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+def token_of(headers: dict) -> str:
+    return headers["Authorization"].removeprefix("Bearer ")
+
+
+def test_membership_is_required_and_follows_joins_and_leaves(api, login):
+    owner, other = login(), login()
+    group = create_group(api, owner)
+    group_id = group["id"]
+    reads = (f"/groups/{group_id}", f"/groups/{group_id}/waypoints/", f"/groups/{group_id}/members/")
+
+    for url in reads:
+        assert api.get(url, headers=other).status_code == 403
+    assert api.post(f"/groups/leave/{group_id}", headers=other).status_code == 404
+    with pytest.raises(ValueError):
+        authenticate(f"token={token_of(other)}&group_id={group_id}")
+
+    assert api.post(f"/groups/join/{group['code']}", headers=other).status_code == 200
+    for url in reads:
+        assert api.get(url, headers=other).status_code == 200
+    assert authenticate(f"token={token_of(other)}&group_id={group_id}")[0] == str(group_id)
+
+    # Cached answers are dropped on leave
+    assert api.post(f"/groups/leave/{group_id}", headers=other).status_code == 200
+    for url in reads:
+        assert api.get(url, headers=other).status_code == 403
+
+
+def test_deleted_group_is_no_longer_readable(api, login):
+    owner = login()
+    group_id = create_group(api, owner)["id"]
+    assert api.get(f"/groups/{group_id}", headers=owner).status_code == 200
+
+    assert api.delete(f"/groups/{group_id}", headers=owner).status_code == 200
+    assert api.get(f"/groups/{group_id}", headers=owner).status_code == 403
+
+
+def revalidate(api, url: str, headers: dict, etag: str):
+    return api.get(url, headers={**headers, "If-None-Match": etag})
+
+
+def test_unchanged_reads_are_answered_with_304(api, login):
+    owner = login()
+    group_id = create_group(api, owner)["id"]
+
+    for url in (f"/groups/{group_id}", "/groups/me/", f"/groups/{group_id}/waypoints/"):
+        response = api.get(url, headers=owner)
+        assert response.status_code == 200
+
+        not_modified = revalidate(api, url, owner, response.headers["ETag"])
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+        assert not_modified.headers["ETag"] == response.headers["ETag"]
+
+
+def test_writes_change_the_etags(api, login):
+    owner, other = login(), login()
+    group = create_group(api, owner)
+    waypoints_url = f"/groups/{group['id']}/waypoints/"
+    groups_etag = api.get("/groups/me/", headers=other).headers["ETag"]
+    waypoints_etag = api.get(waypoints_url, headers=owner).headers["ETag"]
+
+    api.post(f"/groups/join/{group['code']}", headers=other)
+    response = revalidate(api, "/groups/me/", other, groups_etag)
+    assert response.status_code == 200
+    assert [joined["id"] for joined in response.json()["data"]] == [group["id"]]
+
+    api.post(waypoints_url, json={"name": "camp", "lat": 1.0, "long": 2.0}, headers=owner)
+    response = revalidate(api, waypoints_url, owner, waypoints_etag)
+    assert response.status_code == 200
+    assert [waypoint["name"] for waypoint in response.json()["data"]] == ["camp"]
+    assert response.headers["ETag"] != waypoints_etag
+
+
+def test_lists_are_paginated_by_cursor(api, login):
+    owner = login()
+    group = create_group(api, owner)
+    url = f"/groups/{group['id']}/waypoints/"
+    created = [
+        api.post(url, json={"name": f"waypoint {i}", "lat": 1.0, "long": 2.0}, headers=owner).json()["id"]
+        for i in range(5)
+    ]
+
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = api.get(url, params=params, headers=owner).json()
+        pages.append(page)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert [[waypoint["id"] for waypoint in page["data"]] for page in pages] == [created[:2], created[2:4], created[4:]]
+    assert [page["current_page"] for page in pages] == [1, 2, 3]
+    assert {page["total_size"] for page in pages} == {5}
+
+    for _ in range(2):
+        api.post(f"/groups/join/{group['code']}", headers=login())
+    members = api.get(f"/groups/{group['id']}/members/", params={"limit": 2}, headers=owner).json()
+    assert (members["page_size"], members["total_size"]) == (2, 3)
+    assert members["next_cursor"] is not None
+
+
+@pytest.mark.parametrize("params, status", [({"cursor": "not a cursor"}, 400), ({"limit": 0}, 422), ({"limit": 10_000}, 422)])
+def test_invalid_pages_are_rejected(api, login, params, status):
+    assert api.get("/groups/me/", params=params, headers=login()).status_code == status
@@ -0,0 +1,73 @@
+import asyncio
+
+import socketio
+from engineio.async_socket import AsyncSocket
+
+from app.utils.outbound import LatestWinsQueue, TransportBacklog
+
+
+def test_transport_backlog_reads_engineio_queue():
+    # Fails if python-engineio stops exposing `sockets` and `Socket.queue`,
+    # which would silently disable slow consumer detection
+    async def main():
+        sio = socketio.AsyncServer(async_mode="asgi")
+        backlog = TransportBacklog(sio)
+
+        sio.eio.sockets["e1"] = socket = AsyncSocket(sio.eio, "e1")
+        await sio.manager.connect("e1", "/")
+        sid = sio.manager.sid_from_eio_sid("e1", "/")
+
+        assert backlog(sid) == 0
+        socket.queue.put_nowait("packet")
+        socket.queue.put_nowait("packet")
+        assert backlog(sid) == 2
+        assert backlog("unknown") is None
+        assert backlog.supported
+
+    asyncio.run(main())
+
+
+def test_transport_backlog_without_queues():
+    async def main():
+        sio = socketio.AsyncServer(async_mode="asgi")
+        backlog = TransportBacklog(sio)
+
+        sio.eio.sockets["e1"] = object()
+        await sio.manager.connect("e1", "/")
+        sid = sio.manager.sid_from_eio_sid("e1", "/")
+
+        assert backlog(sid) is None
+        assert not backlog.supported
+
+    asyncio.run(main())
+
+
+def position(user_id: int, lat: float = 0) -> dict:
+    return {"id": user_id, "lat": lat, "long": 0}
+
+
+def test_latest_wins_queue_replaces_member_update():
+    queue = LatestWinsQueue(maxsize=10, since=0)
+
+    assert queue.put("1", position(1, lat=1), seq=1) is None
+    assert queue.put("1", position(2), seq=2) is None
+    assert queue.put("1", position(1, lat=2), seq=3) == "replaced"
+    # The same user in another group is another entry
+    assert queue.put("2", position(1), seq=1) is None
+
+    assert len(queue) == 3
+    assert queue.drain() == {
+        "1": [(2, position(2)), (3, position(1, lat=2))],
+        "2": [(1, position(1))],
+    }
+    assert len(queue) == 0
+
+
+def test_latest_wins_queue_drops_oldest_on_overflow():
+    queue = LatestWinsQueue(maxsize=2, since=0)
+
+    queue.put("1", position(1), seq=1)
+    queue.put("1", position(2), seq=2)
+    assert queue.put("1", position(3), seq=3) == "overflow"
+
+    assert queue.drain() == {"1": [(2, position(2)), (3, position(3))]}
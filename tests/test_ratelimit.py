@@ -0,0 +1,39 @@
+from app.utils.ratelimit import TokenBucketLimiter
+
+
+def test_burst_then_limited():
+    limiter = TokenBucketLimiter(rate=2, burst=3)
+
+    assert [limiter.allow("a", now=0) for _ in range(4)] == [True, True, True, False]
+    assert limiter.stats() == {"keys": 1, "allowed": 3, "limited": 1}
+
+
+def test_tokens_refill_at_rate():
+    limiter = TokenBucketLimiter(rate=2, burst=3)
+    for _ in range(3):
+        limiter.allow("a", now=0)
+
+    # Half a second at 2 tokens per second is one token
+    assert limiter.allow("a", now=0.5)
+    assert not limiter.allow("a", now=0.5)
+    assert not limiter.allow("a", now=0.7)
+    assert limiter.allow("a", now=1.0)
+
+
+def test_refill_is_capped_at_burst():
+    limiter = TokenBucketLimiter(rate=2, burst=3)
+    limiter.allow("a", now=0)
+
+    results = [limiter.allow("a", now=100) for _ in range(4)]
+    assert results == [True, True, True, False]
+
+
+def test_keys_have_their_own_bucket():
+    limiter = TokenBucketLimiter(rate=1, burst=1)
+
+    assert limiter.allow("a", now=0)
+    assert not limiter.allow("a", now=0)
+    assert limiter.allow("b", now=0)
+
+    limiter.forget("a")
+    assert limiter.allow("a", now=0)
@@ -0,0 +1,42 @@
+import asyncio
+
+from app.core.realtime_backend import MemoryStateBackend
+
+
+def test_remove_member_checks_the_owner():
+    async def main():
+        backend = MemoryStateBackend()
+        await backend.set_members([("7", 1, {"id": 1}, "a:1"), ("7", 2, {"id": 2}, "a:2")])
+        # User 1 reconnected on worker b
+        await backend.set_members([("7", 1, {"id": 1, "lat": 1.0}, "b:1")])
+
+        assert not await backend.remove_member("7", 1, "a:1")
+        assert await backend.remove_member("7", 2, "a:2")
+        assert await backend.get_members("7") == [{"id": 1, "lat": 1.0}]
+
+    asyncio.run(main())
+
+
+def test_members_expire_unless_rewritten():
+    async def main():
+        backend = MemoryStateBackend(member_ttl=0.1)
+        await backend.set_members([("7", 1, {"id": 1}, "a:1"), ("7", 2, {"id": 2}, "a:2")])
+
+        await asyncio.sleep(0.06)
+        await backend.set_members([("7", 2, {"id": 2}, "a:2")])
+        await asyncio.sleep(0.06)
+
+        assert await backend.get_members("7") == [{"id": 2}]
+
+    asyncio.run(main())
+
+
+def test_members_never_expire_without_ttl():
+    async def main():
+        backend = MemoryStateBackend()
+        await backend.set_members([("7", 1, {"id": 1}, "a:1")])
+        await asyncio.sleep(0.01)
+
+        assert await backend.get_members("7") == [{"id": 1}]
+
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+from app.utils.scheduler import TimerWheel
+
+
+def handler(items):
+    pass
+
+
+def advance(wheel: TimerWheel, ticks: int) -> list:
+    fired = []
+    for _ in range(ticks):
+        fired.append(wheel._advance().get(handler, []))
+    return fired
+
+
+def test_timer_fires_after_delay():
+    wheel = TimerWheel(tick=1, slots=8)
+    wheel.schedule(3, handler, "a")
+
+    assert advance(wheel, 3) == [[], [], ["a"]]
+    assert len(wheel) == 0
+
+
+def test_delay_rounds_up_to_whole_ticks():
+    wheel = TimerWheel(tick=1, slots=8)
+    wheel.schedule(0.2, handler, "a")
+    wheel.schedule(1.5, handler, "b")
+
+    assert advance(wheel, 2) == [["a"], ["b"]]
+
+
+def test_timer_beyond_one_turn_waits_for_its_rounds():
+    wheel = TimerWheel(tick=1, slots=4)
+    timer = wheel.schedule(10, handler, "a")
+
+    assert timer.rounds == 2
+    fired = advance(wheel, 12)
+    assert fired.index(["a"]) == 9
+    assert sum(fired, []) == ["a"]
+
+
+def test_timers_of_a_tick_are_batched_per_handler():
+    wheel = TimerWheel(tick=1, slots=8)
+    other = []
+    wheel.schedule(2, handler, "a")
+    wheel.schedule(2, handler, "b")
+    wheel.schedule(2, other.extend, "c")
+
+    wheel._advance()
+    batches = wheel._advance()
+    assert sorted(batches[handler]) == ["a", "b"]
+    assert batches[other.extend] == ["c"]
+
+
+def test_cancelled_timer_never_fires():
+    wheel = TimerWheel(tick=1, slots=4)
+    timer = wheel.schedule(6, handler, "a")
+    wheel.schedule(6, handler, "b")
+    timer.cancel()
+
+    assert len(wheel) == 1
+    assert sum(advance(wheel, 10), []) == ["b"]
+
+
+def test_cancel_after_firing_is_harmless():
+    wheel = TimerWheel(tick=1, slots=4)
+    timer = wheel.schedule(1, handler, "a")
+
+    assert advance(wheel, 1) == [["a"]]
+    timer.cancel()
+    assert len(wheel) == 0
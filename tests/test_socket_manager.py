@@ -0,0 +1,371 @@
+import asyncio
+import time
+
+import pytest
+import socketio
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.persistence import PositionWriter
+from app.core.realtime_backend import LoopbackManager, MemoryStateBackend
+from app.socket_manager import PositionManager, parse_position
+from app.utils.geo import Area
+from app.utils.movement import MovementFilter
+
+
+class Server:
+    """
+    A PositionManager on its own Socket.IO server, recording every emit.
+    Sockets are connected to the server's manager without a transport.
+    """
+
+    def __init__(self, backend=None, client_manager=None):
+        self.sio = socketio.AsyncServer(async_mode="asgi", client_manager=client_manager)
+        self.manager = PositionManager(self.sio, backend or MemoryStateBackend())
+        self.events: list[tuple[str, object, str | None, str | None]] = []
+
+        emit = self.sio.emit
+
+        async def record(event, data=None, to=None, room=None, skip_sid=None, **kwargs):
+            self.events.append((event, data, to or room, skip_sid))
+            await emit(event, data=data, to=to, room=room, skip_sid=skip_sid, **kwargs)
+
+        self.sio.emit = record
+
+    async def connect(self, eio_sid: str) -> str:
+        await self.sio.manager.connect(eio_sid, "/")
+        return self.sio.manager.sid_from_eio_sid(eio_sid, "/")
+
+    def sent(self, event: str) -> list[tuple[object, str | None, str | None]]:
+        return [(data, to, skip_sid) for name, data, to, skip_sid in self.events if name == event]
+
+
+def user(user_id: int, **position) -> dict:
+    return {"id": user_id, "username": f"user{user_id}", **position}
+
+
+def test_parse_position():
+    now = time.time()
+
+    assert parse_position({"lat": 48.85, "long": 2.35}) == {"lat": 48.85, "long": 2.35}
+    assert parse_position({"lat": 48.85, "long": 2.35, "timestamp": now}) == {
+        "lat": 48.85,
+        "long": 2.35,
+        "timestamp": now,
+    }
+    # Clients clear their position with nulls
+    assert parse_position({"lat": None, "long": None}) == {"lat": None, "long": None}
+
+
+def test_parse_position_ignores_identity():
+    assert parse_position({"id": 2, "username": "other", "lat": 1.0, "long": 2.0}) == {"lat": 1.0, "long": 2.0}
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        None,
+        [1.0, 2.0],
+        {"lat": 1.0},
+        {"lat": "1.0", "long": 2.0},
+        {"lat": 91.0, "long": 2.0},
+        {"lat": 1.0, "long": -180.5},
+        {"lat": 1.0, "long": 2.0, "speed": 3},
+        {"lat": 1.0, "long": 2.0, "timestamp": -1},
+    ],
+)
+def test_parse_position_rejects_invalid_payloads(data):
+    assert parse_position(data) is None
+
+
+def test_parse_position_rejects_skewed_timestamps():
+    skew = settings.POSITION_TIMESTAMP_TOLERANCE + 60
+
+    assert parse_position({"lat": 1.0, "long": 2.0, "timestamp": time.time() - skew}) is None
+    assert parse_position({"lat": 1.0, "long": 2.0, "timestamp": time.time() + skew}) is None
+
+
+def test_interest_is_cleared_after_the_member_left():
+    async def main():
+        server = Server()
+        manager = server.manager
+        sid = await server.connect("e1")
+        other = await server.connect("e2")
+        await manager.join(sid, "7", user(1))
+        await manager.join(other, "7", user(2))
+        manager.set_interest(sid, Area(bbox=(0, 0, 1, 1)))
+        manager.set_interest(other, Area(bbox=(0, 0, 1, 1)))
+
+        # client_stop_sharing, then the socket disconnects
+        await manager.remove_users([sid])
+        manager.clear_interest(sid)
+        # A second socket of user 2 replaces the first, which then disconnects
+        await manager.join(await server.connect("e3"), "7", user(2))
+        manager.clear_interest(other)
+
+        assert manager._interests == {}
+        assert manager._interest_groups == {}
+
+    asyncio.run(main())
+
+
+class FailingBackend(MemoryStateBackend):
+    down = False
+
+    async def set_members(self, members):
+        if self.down:
+            raise ConnectionError("state backend down")
+        await super().set_members(members)
+
+    async def remove_member(self, group_id, user_id, owner):
+        if self.down:
+            raise ConnectionError("state backend down")
+        return await super().remove_member(group_id, user_id, owner)
+
+
+def test_stop_removes_the_members_of_the_worker(monkeypatch):
+    monkeypatch.setattr(PositionWriter, "_write", staticmethod(lambda batch: None))
+
+    async def main():
+        backend = MemoryStateBackend()
+        first, second = Server(backend), Server(backend)
+        await first.manager.join(await first.connect("e1"), "7", user(1))
+        await second.manager.join(await second.connect("e2"), "7", user(2))
+
+        await first.manager.stop()
+
+        assert await backend.get_members("7") == [user(2)]
+
+    asyncio.run(main())
+
+
+def test_refresh_keeps_idle_members_alive():
+    async def main():
+        server = Server(MemoryStateBackend(member_ttl=0.1))
+        await server.manager.join(await server.connect("e1"), "7", user(1))
+
+        for _ in range(3):
+            await asyncio.sleep(0.05)
+            await server.manager.refresh_members()
+
+        assert await server.manager.backend.get_members("7") == [user(1)]
+
+    asyncio.run(main())
+
+
+def test_remove_users_cleans_up_when_the_backend_fails():
+    async def main():
+        server = Server(FailingBackend())
+        manager = server.manager
+        sid = await server.connect("e1")
+        await manager.join(sid, "7", user(1))
+        await manager.update_position(sid, user(1, lat=1.0, long=2.0))
+        manager.backend.down = True
+
+        manager.schedule_removal(sid, 0)
+        await manager.remove_users([sid])
+
+        assert manager.get_user(sid) is None
+        assert manager.get_user_sid(1) is None
+        assert manager.pending_disconnects() == 0
+        [((data, seq), to, _)] = server.sent("client_disconnect")
+        assert data == user(1, lat=1.0, long=2.0)
+        assert to == "7"
+
+    asyncio.run(main())
+
+
+def test_nearby_searches_the_whole_group_across_workers():
+    async def main():
+        backend = MemoryStateBackend()
+        first = Server(backend, LoopbackManager(channel="nearby"))
+        second = Server(backend, LoopbackManager(channel="nearby"))
+        here, there = await first.connect("e1"), await second.connect("e2")
+        await first.manager.join(here, "7", user(1))
+        await second.manager.join(there, "7", user(2))
+        await first.manager.update_position(here, user(1, lat=1.0, long=2.0))
+        await second.manager.update_position(there, user(2, lat=1.001, long=2.0))
+        await second.manager.flush_members()
+
+        found = await first.manager.nearby("7", lat=1.0, long=2.0, radius=500)
+        assert [member["id"] for member in found] == [1, 2]
+
+        found = await first.manager.nearby("7", bbox=(1.0005, 1.9, 1.1, 2.1))
+        assert found == [{**user(2, lat=1.001, long=2.0), "distance": None}]
+
+    asyncio.run(main())
+
+
+def test_nearby_uses_the_local_index_without_a_bus():
+    async def main():
+        server = Server()
+        sid = await server.connect("e1")
+        await server.manager.join(sid, "7", user(1))
+        await server.manager.update_position(sid, user(1, lat=1.0, long=2.0))
+
+        [found] = await server.manager.nearby("7", lat=1.0, long=2.0, k=5)
+        assert found["id"] == 1
+        assert await server.manager.nearby("8", lat=1.0, long=2.0, k=5) == []
+
+    asyncio.run(main())
+
+
+def test_held_position_is_sent_and_counted_once():
+    async def main():
+        server = Server()
+        manager = server.manager
+        manager.movement = MovementFilter(min_distance=1000, min_interval=0, keepalive=0.2)
+        sid = await server.connect("e1")
+        await manager.join(sid, "held", user(1))
+
+        await manager.update_position(sid, user(1, lat=1.0, long=2.0))
+        await manager.update_position(sid, user(1, lat=1.0001, long=2.0))
+        assert 1 in manager._held_timers
+
+        # Not due yet, held again
+        await manager.flush_held([1])
+        assert server.sent("server_update_positions") == []
+
+        await asyncio.sleep(0.2)
+        await manager.flush_held([1])
+        [((positions, seq), to, _)] = server.sent("server_update_positions")
+        assert positions == [user(1, lat=1.0001, long=2.0)]
+        assert to == "held:json"
+
+        count = lambda result: metrics.position_broadcasts.labels("held", result)._value.get()
+        assert (count("broadcast"), count("suppressed"), count("held")) == (1, 1, 1)
+
+    asyncio.run(main())
+
+
+def test_join_sends_the_roster_to_the_new_member_only():
+    async def main():
+        server = Server()
+        manager = server.manager
+        first = await server.connect("e1")
+        await manager.join(first, "7", user(1))
+        server.events.clear()
+
+        second = await server.connect("e2")
+        await manager.join(second, "7", user(2))
+
+        [(roster, to, _)] = server.sent("server_data")
+        assert sorted(roster, key=lambda member: member["id"]) == [user(1), user(2)]
+        assert to == second
+        [((data, seq), to, skip_sid)] = server.sent("member_joined")
+        assert (data, to, skip_sid) == (user(2), "7", second)
+
+        # A reconnect replaces the member, the group already knows it
+        server.events.clear()
+        await manager.join(await server.connect("e3"), "7", user(2))
+        assert server.sent("member_joined") == []
+        assert len(await manager.backend.get_members("7")) == 2
+
+    asyncio.run(main())
+
+
+def test_resume_sends_only_the_missed_events():
+    async def main():
+        server = Server()
+        manager = server.manager
+        first, second = await server.connect("e1"), await server.connect("e2")
+        await manager.join(first, "7", user(1))
+        await manager.join(second, "7", user(2))
+        [(session, to, _)] = [sent for sent in server.sent("server_session") if sent[1] == second]
+
+        for lat in (1.0, 1.5, 2.0):
+            await manager.update_position(first, user(1, lat=lat, long=3.0))
+        server.events.clear()
+
+        resumed = await server.connect("e3")
+        await manager.join(resumed, "7", user(2), resume=(session["epoch"], session["seq"]))
+
+        assert server.sent("server_data") == []
+        [(data, to, _)] = server.sent("server_resume")
+        assert to == resumed
+        # Only the latest position of each member is replayed
+        assert data["events"] == [
+            {"seq": session["seq"] + 1, "event": "member_joined", "data": user(2)},
+            {"seq": data["seq"], "event": "server_update_position", "data": user(1, lat=2.0, long=3.0)},
+        ]
+
+    asyncio.run(main())
+
+
+def test_resume_falls_back_to_a_snapshot():
+    async def main():
+        server = Server()
+        manager = server.manager
+        manager.buffer_size = 2
+        sid = await server.connect("e1")
+        await manager.join(sid, "7", user(1))
+        for lat in (1.0, 1.5, 2.0):
+            await manager.update_position(sid, user(1, lat=lat, long=3.0))
+
+        # Gap no longer buffered, then a session of another process
+        for resume in ((manager.epoch, 0), ("other", manager._sequences["7"])):
+            server.events.clear()
+            resumed = await server.connect(f"e-{resume[0]}")
+            await manager.join(resumed, "7", user(2), resume=resume)
+
+            assert server.sent("server_resume") == []
+            [(roster, to, _)] = server.sent("server_data")
+            assert to == resumed
+
+    asyncio.run(main())
+
+
+def test_slow_consumer_gets_the_latest_positions_once_caught_up():
+    async def main():
+        server = Server()
+        manager = server.manager
+        backlog = {}
+        manager._transport_backlog = backlog.get
+        slow, fast, mover = [await server.connect(eio_sid) for eio_sid in ("e1", "e2", "e3")]
+        for user_id, sid in enumerate((slow, fast, mover), start=1):
+            await manager.join(sid, "7", user(user_id))
+        server.events.clear()
+
+        backlog.update({slow: settings.OUTBOUND_HIGH_WATERMARK, fast: 0, mover: 0})
+        await manager.check_outbound()
+        for lat in (1.0, 1.5, 2.0):
+            await manager.update_position(mover, user(3, lat=lat, long=3.0))
+
+        # The room broadcasts leave the slow socket out
+        broadcasts = server.sent("server_update_position")
+        assert len(broadcasts) == 3
+        assert all(slow in skip_sid for _, _, skip_sid in broadcasts)
+        assert len(manager._outbound[slow]) == 1
+
+        backlog[slow] = settings.OUTBOUND_LOW_WATERMARK
+        await manager.check_outbound()
+        [((positions, seq), to, _)] = server.sent("server_update_positions")
+        assert (positions, seq, to) == ([user(3, lat=2.0, long=3.0)], manager._sequences["7"], slow)
+        assert manager._outbound == {}
+
+    asyncio.run(main())
+
+
+def test_slow_consumer_is_disconnected_when_it_stays_behind():
+    async def main():
+        server = Server()
+        manager = server.manager
+        sid = await server.connect("e1")
+        await manager.join(sid, "7", user(1))
+        manager._transport_backlog = {sid: settings.OUTBOUND_HIGH_WATERMARK}.get
+        disconnected = []
+
+        async def disconnect(sid, **kwargs):
+            disconnected.append(sid)
+
+        server.sio.disconnect = disconnect
+
+        await manager.check_outbound()
+        assert disconnected == []
+
+        manager._outbound[sid].since -= settings.SLOW_CONSUMER_TIMEOUT
+        await manager.check_outbound()
+        assert disconnected == [sid]
+        assert manager._outbound == {}
+
+    asyncio.run(main())